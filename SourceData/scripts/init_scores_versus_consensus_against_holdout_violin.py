@@ -13,22 +13,19 @@
 
 import argparse
 import os
-import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
-import scipy
 
-from fets_paper_figures import my_violin_plot, prep_plots, other_font_size
-from fets_paper_figures import save_at_dpi, dice_or_jaccard
+from fets_paper_figures import my_violin_plot, prep_plots, other_font_size, read_source_csv
+from fets_paper_figures import save_at_dpi, dice_or_jaccard, paired_wilcoxon, bootstrap_percent_increase_ci
 
-def main(data_pardir, output_pardir, jaccard ):
+def main(data_pardir, output_pardir, jaccard, bootstrap_resamples, n_jobs):
 
     BINARY_DICE='Tumor Sub-Compartment'
 
     new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, DICE_OR_JACCARD = dice_or_jaccard(jaccard)    
 
-    final_consensus_val_df = pd.read_csv(os.path.join(data_pardir, 'final_consensus_val_df.csv'))
-    init_val_df = pd.read_csv(os.path.join(data_pardir, 'init_val_df.csv'))
+    final_consensus_val_df = read_source_csv(data_pardir, 'final_consensus_val_df.csv')
+    init_val_df = read_source_csv(data_pardir, 'init_val_df.csv')
 
 
     percent_increases = {}
@@ -61,16 +58,22 @@ def main(data_pardir, output_pardir, jaccard ):
     meanline_shifts = {0: 0.5, 1: -0.5 }
 
     # getting p values for comparisons
-    pvalues = {}
-    for metric in temp_df[BINARY_DICE].unique():
-        samples_1 = temp_df[(temp_df["Model Type"] == "Public Initial Model") & (temp_df[BINARY_DICE] == metric)][IN_DF_DICE_OR_JACCARD].values
-        samples_2 = temp_df[(temp_df["Model Type"] == 'Full Federation Consensus') & (temp_df[BINARY_DICE] == metric)][IN_DF_DICE_OR_JACCARD].values
-        if len(samples_1) != len(samples_2):
-            print("lengths of samples_1 and samples_2 are: ", len(samples_1), len(samples_2))
-        stat, pvalue = scipy.stats.wilcoxon(samples_1, samples_2)
-        m1, m2 = np.mean(samples_1), np.mean(samples_2)
-        sd1, sd2 = np.std(samples_1), np.std(samples_2)
-        pvalues[metric] = pvalue 
+    tests = paired_wilcoxon(df=temp_df, 
+                            model_column="Model Type", 
+                            region_column=BINARY_DICE, 
+                            value_column=IN_DF_DICE_OR_JACCARD, 
+                            comparisons=[("Public Initial Model", 'Full Federation Consensus')])
+    pvalues = dict(zip(tests[BINARY_DICE], tests['pvalue']))
+
+    if bootstrap_resamples > 0:
+        increase_cis = bootstrap_percent_increase_ci(df=temp_df, 
+                                                     model_column="Model Type", 
+                                                     region_column=BINARY_DICE, 
+                                                     value_column=IN_DF_DICE_OR_JACCARD, 
+                                                     comparisons=[("Public Initial Model", 'Full Federation Consensus')], 
+                                                     n_resamples=bootstrap_resamples, 
+                                                     n_jobs=n_jobs)
+        print(f"\nBootstrap 95% confidence intervals of the percent increases over {bootstrap_resamples} resamples:\n{increase_cis[[BINARY_DICE, 'percent_increase', 'ci_low', 'ci_high']]}\n")
 
     temp_df = temp_df.rename({IN_DF_DICE_OR_JACCARD: DICE_OR_JACCARD}, axis=1)
         
@@ -181,9 +184,12 @@ def main(data_pardir, output_pardir, jaccard ):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
     parser.add_argument('--jaccard', '-j', action='store_true', help='Whether or not to convert DICE scores to Jaccard index.')
+    parser.add_argument('--bootstrap_resamples', '-br', type=int, default=0, 
+                        help='Number of bootstrap resamples for confidence intervals of the percent increases (none are computed if 0).')
+    parser.add_argument('--n_jobs', '-nj', type=int, default=1, help='Number of processes to spread the bootstrap resamples across.')
     args = parser.parse_args()
     main(**vars(args))
 
@@ -14,18 +14,17 @@
 import argparse
 
 import os
-import pandas as pd
 
-from fets_paper_figures import prep_plots, aggregated_fine_grained_binary_dice_over_rounds, dice_or_jaccard
+from fets_paper_figures import prep_plots, aggregated_fine_grained_binary_dice_over_rounds, dice_or_jaccard, read_source_csv
     
 
-def main(data_pardir, output_pardir, jaccard):
+def main(data_pardir, output_pardir, jaccard, analytic_envelope):
     # This function produces a validation curve for institution 48
 
     new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, DICE_OR_JACCARD = dice_or_jaccard(jaccard)
  
 
-    df = pd.read_csv(os.path.join(data_pardir, 'val_df_final.csv'))    
+    df = read_source_csv(data_pardir, 'val_df_final.csv', compact=True)    
     prep_plots()
 
 
@@ -47,13 +46,16 @@ def main(data_pardir, output_pardir, jaccard):
                                                     metric_value_column_name=DICE_OR_JACCARD, 
                                                     custom_title='Local Validation For Site 48', 
                                                     model_version_column_name='FL Training Round', 
-                                                    metric_names=metrics)
+                                                    metric_names=metrics, 
+                                                    analytic_envelope=analytic_envelope)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
     parser.add_argument('--jaccard', '-j', action='store_true', help='Whether or not to convert DICE scores to Jaccard index.')  
+    parser.add_argument('--analytic_envelope', '-ae', action='store_true', 
+                        help='Draw t confidence intervals computed for all rounds at once instead of bootstrapping every round.')
     args = parser.parse_args()
     main(**vars(args))
\ No newline at end of file
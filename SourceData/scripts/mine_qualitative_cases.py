@@ -0,0 +1,48 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import argparse, os
+
+import pandas as pd
+
+from fets_paper_figures import BINARY_DICE, IN_DF_DICE, improvement_frame, pick_quantile_cases, export_picked_cases
+
+def main(scores_fpath, cases_dir, output_pardir, consensus_model, baseline_model, regions, copy):
+
+    # long per case scores, as written by score_case_directories.py
+    scores = pd.read_csv(scores_fpath)
+    improvements = improvement_frame(scores,
+                                     consensus_model=consensus_model,
+                                     baseline_model=baseline_model,
+                                     model_column='Model Type',
+                                     region_column=BINARY_DICE,
+                                     value_column=IN_DF_DICE)
+    picks = pick_quantile_cases(improvements[regions])
+    print(f"Picked cases among {len(improvements)} cases:\n{picks}\n")
+
+    output_dir = os.path.join(output_pardir, 'QualitativeExamples')
+    folders = export_picked_cases(picks, cases_dir, output_dir, consensus_model=consensus_model, baseline_model=baseline_model, link=not copy)
+    print(f"Saved {len(folders)} qualitative cases at: {output_dir}\n")
+    picks.to_csv(os.path.join(output_dir, 'picked_cases.csv'), index=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scores_fpath', '-sf', type=str, default="../../output/case_scores.csv", help='Absolute path to the per case scores csv.')
+    parser.add_argument('--cases_dir', '-cd', type=str, help='Absolute path to the folder holding the case folders.', default="../../QualitativeExamples")
+    parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
+    parser.add_argument('--consensus_model', '-cm', type=str, default='Consensus')
+    parser.add_argument('--baseline_model', '-bm', type=str, default='PIM')
+    parser.add_argument('--regions', '-r', type=str, nargs='+', default=['Average'], help='Regions to pick cases for (Average, WT, TC, ET).')
+    parser.add_argument('--copy', '-c', action='store_true', help='Copy the NIfTI files instead of linking them.')
+    args = parser.parse_args()
+    main(**vars(args))
@@ -11,16 +11,38 @@
 # limitations under the License.
 
 
-import argparse, os
+import argparse
 import pandas as pd
 
+from fets_paper_figures import read_source_csv, pairwise_permutation_table
 
-def main(data_pardir):
-    pval_singlet_triplet_tight_df = pd.read_csv(os.path.join(data_pardir, 'p_value_for_singlet_and_triplet_pairs_tight.csv'))
+
+def main(data_pardir, scores_fpath, model_column, case_column, value_column, n_permutations, n_jobs, output_fpath):
+    if scores_fpath is None:
+        pval_singlet_triplet_tight_df = read_source_csv(data_pardir, 'p_value_for_singlet_and_triplet_pairs_tight.csv')
+    else:
+        # regenerate the p-values from per case scores, e.g. for new federation subsets
+        pval_singlet_triplet_tight_df = pairwise_permutation_table(df=pd.read_csv(scores_fpath), 
+                                                                   model_column=model_column,
+                                                                   case_column=case_column,
+                                                                   value_column=value_column,
+                                                                   n_permutations=n_permutations,
+                                                                   n_jobs=n_jobs).reset_index()
+        if output_fpath is not None:
+            print(f"Saving p-value table at: {output_fpath}\n")
+            pval_singlet_triplet_tight_df.to_csv(output_fpath, index=False)
     print(pval_singlet_triplet_tight_df.to_latex())
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
+    parser.add_argument('--scores_fpath', '-sf', type=str, default=None, 
+                        help='Path to a csv of per case scores (one row per model and case) to compute the p-values from, instead of reading them from the data parent directory.')
+    parser.add_argument('--model_column', '-mc', type=str, default='Model', help='Column of the scores csv holding the model (federation) names.')
+    parser.add_argument('--case_column', '-cc', type=str, default='Case', help='Column of the scores csv holding the case identifiers.')
+    parser.add_argument('--value_column', '-vc', type=str, default='DICE', help='Column of the scores csv holding the scores to compare.')
+    parser.add_argument('--n_permutations', '-np', type=int, default=10000, help='Number of random sign flips per test (all are enumerated when there are fewer).')
+    parser.add_argument('--n_jobs', '-nj', type=int, default=1, help='Number of processes to spread the permutations across.')
+    parser.add_argument('--output_fpath', '-of', type=str, default=None, help='Where to write the regenerated p-value table as csv.')
     args = parser.parse_args()
     main(**vars(args))
\ No newline at end of file
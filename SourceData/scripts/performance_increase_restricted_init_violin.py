@@ -14,27 +14,31 @@
 import argparse
 
 import os
-import numpy as np
-import scipy 
 import matplotlib.pyplot as plt
-import pandas as pd   
 
-from fets_paper_figures import prep_plots, get_comparison_df_detailed, my_violin_plot, interp_MBD_best_round, save_at_dpi
-from fets_paper_figures import other_font_size, compute_increases, dice_or_jaccard
+from fets_paper_figures import prep_plots, get_comparison_df_detailed, my_violin_plot, interp_MBD_best_round, save_at_dpi, read_source_csv
+from fets_paper_figures import other_font_size, compute_increases, dice_or_jaccard, select_best_round, BEST_ROUND_CRITERIA, paired_wilcoxon
+from fets_paper_figures import bootstrap_percent_increase_ci
 
-def main(data_pardir, output_pardir, jaccard):    
+def main(data_pardir, output_pardir, jaccard, best_round_criterion, bootstrap_resamples, n_jobs):    
     
     prep_plots()
 
     new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, DICE_OR_JACCARD = dice_or_jaccard(jaccard)
 
-    df = pd.read_csv(os.path.join(data_pardir, 'val_df_final.csv'))
+    df = read_source_csv(data_pardir, 'val_df_final.csv', compact=True)
 
-    vmodel_score, init_score, restricted_init_score, percent_increase_restricted = compute_increases(model_round=interp_MBD_best_round, 
+    if best_round_criterion is None:
+        best_round = interp_MBD_best_round
+    else:
+        best_round = select_best_round(df, metric='MeanBinary' + IN_DF_DICE_OR_JACCARD, criterion=best_round_criterion)
+        print(f"\nUsing round {best_round}, selected by the {best_round_criterion} criterion.")
+
+    vmodel_score, init_score, restricted_init_score, percent_increase_restricted = compute_increases(model_round=best_round, 
                                                                                                      df=df, 
                                                                                                      jaccard=jaccard)
 
-    spread_version_df, spread_init_df = get_comparison_df_detailed(model_round=interp_MBD_best_round, 
+    spread_version_df, spread_init_df = get_comparison_df_detailed(model_round=best_round, 
                                                                    df=df, 
                                                                    jaccard=jaccard)
 
@@ -50,17 +54,24 @@ def main(data_pardir, output_pardir, jaccard):
             (0.8705882352941177, 0.5607843137254902, 0.0196078431372549)]
 
     # getting p values for comparisons
-    pvalues = {}
-    for metric in compare_with_restriced_inits_df_details["Tumor Sub-Compartment"].unique():
-        samples_1 = compare_with_restriced_inits_df_details[(compare_with_restriced_inits_df_details["Model"] == "Public Initial Model") & (compare_with_restriced_inits_df_details["Tumor Sub-Compartment"] == metric)][DICE_OR_JACCARD].values
-        samples_2 = compare_with_restriced_inits_df_details[(compare_with_restriced_inits_df_details["Model"] == 'Full Federation Consensus') & (compare_with_restriced_inits_df_details["Tumor Sub-Compartment"] == metric)][DICE_OR_JACCARD].values
-        min_length = min(len(samples_1), len(samples_2))
-        samples_1 = samples_1[:min_length]
-        samples_2 = samples_2[:min_length]
-        stat, pvalue = scipy.stats.wilcoxon(samples_1, samples_2)
-        m1, m2 = np.mean(samples_1), np.mean(samples_2)
-        sd1, sd2 = np.std(samples_1), np.std(samples_2)
-        pvalues[metric] = pvalue
+    tests = paired_wilcoxon(df=compare_with_restriced_inits_df_details, 
+                            model_column="Model", 
+                            region_column="Tumor Sub-Compartment", 
+                            value_column=DICE_OR_JACCARD, 
+                            comparisons=[("Public Initial Model", 'Full Federation Consensus')], 
+                            truncate=True)
+    pvalues = dict(zip(tests["Tumor Sub-Compartment"], tests['pvalue']))
+
+    if bootstrap_resamples > 0:
+        increase_cis = bootstrap_percent_increase_ci(df=compare_with_restriced_inits_df_details, 
+                                                     model_column="Model", 
+                                                     region_column="Tumor Sub-Compartment", 
+                                                     value_column=DICE_OR_JACCARD, 
+                                                     comparisons=[("Public Initial Model", 'Full Federation Consensus')], 
+                                                     truncate=True, 
+                                                     n_resamples=bootstrap_resamples, 
+                                                     n_jobs=n_jobs)
+        print(f"\nBootstrap 95% confidence intervals of the percent increases over {bootstrap_resamples} resamples:\n{increase_cis[['Tumor Sub-Compartment', 'percent_increase', 'ci_low', 'ci_high']]}\n")
         
     # get the PIM to appear first
     sorting_key = lambda x: x.apply(lambda x: {'Full Federation Consensus': 1,
@@ -195,8 +206,13 @@ def main(data_pardir, output_pardir, jaccard):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
     parser.add_argument('--jaccard', '-j', action='store_true', help='Whether or not to convert DICE scores to Jaccard index.')
+    parser.add_argument('--best_round_criterion', '-brc', type=str, choices=BEST_ROUND_CRITERIA, default=None, 
+                        help='Select the round to compare against the initial model with this criterion instead of using the round from the paper.')
+    parser.add_argument('--bootstrap_resamples', '-br', type=int, default=0, 
+                        help='Number of bootstrap resamples for confidence intervals of the percent increases (none are computed if 0).')
+    parser.add_argument('--n_jobs', '-nj', type=int, default=1, help='Number of processes to spread the bootstrap resamples across.')
     args = parser.parse_args()
     main(**vars(args))
\ No newline at end of file
@@ -14,11 +14,7 @@
 import argparse
 import os
 
-import numpy as np
-import pandas as pd
-import scipy
-
-from fets_paper_figures import prep_plots, save_at_dpi, my_violin_plot, dice_or_jaccard
+from fets_paper_figures import prep_plots, save_at_dpi, my_violin_plot, dice_or_jaccard, read_source_csv, paired_wilcoxon
 
 BINARY_DICE = 'Tumor Sub-Compartment'
 
@@ -32,10 +28,10 @@ def main(data_pardir, output_pardir, jaccard):
 
     new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, DICE_OR_JACCARD = dice_or_jaccard(jaccard)
 
-    prelim_consensus_df = pd.read_csv(os.path.join(data_pardir, 'prelim_consensus_df.csv'))
-    init_val_inhouse_only_df = pd.read_csv(os.path.join(data_pardir, 'init_val_inhouse_only_df.csv'))
-    single_models_val_df = pd.read_csv(os.path.join(data_pardir, 'single_models_val_df.csv'))
-    consensus_model_results_inhouse_only_df = pd.read_csv(os.path.join(data_pardir, 'consensus_model_results_inhouse_only_df.csv'))
+    prelim_consensus_df = read_source_csv(data_pardir, 'prelim_consensus_df.csv')
+    init_val_inhouse_only_df = read_source_csv(data_pardir, 'init_val_inhouse_only_df.csv')
+    single_models_val_df = read_source_csv(data_pardir, 'single_models_val_df.csv')
+    consensus_model_results_inhouse_only_df = read_source_csv(data_pardir, 'consensus_model_results_inhouse_only_df.csv')
 
     prep_plots()
 
@@ -53,30 +49,19 @@ def main(data_pardir, output_pardir, jaccard):
                                 'Preliminary Federation Consensus': 2, 
                                 'Full Federation Consensus': 3}
 
-    fed_samples = {"Preliminary Federation Consensus": {}, 
-                "Full Federation Consensus": {}}
-
     # getting p values for comparisons
-    pvalues = {"init vs Preliminary federation consensus": {}, 
-            "init vs Full federation consensus": {}, 
-            "Preliminary consens vs full consens": {}}
-    for model_type in [("Preliminary Federation Consensus", "init vs Preliminary federation consensus"), 
-                    ("Full Federation Consensus", "init vs Full federation consensus")]:
-        for metric in init_val_inhouse_only_df[BINARY_DICE].unique():
-            samples_1 = temp_df[(temp_df["Model Type"] == "Public Initial Model") & (temp_df[BINARY_DICE] == metric)][DICE_OR_JACCARD].values
-            samples_2 = temp_df[(temp_df["Model Type"] == model_type[0]) & (temp_df[BINARY_DICE] == metric)][DICE_OR_JACCARD].values
-            stat, pvalue = scipy.stats.wilcoxon(samples_1, samples_2)
-            m1, m2 = np.mean(samples_1), np.mean(samples_2)
-            sd1, sd2 = np.std(samples_1), np.std(samples_2)
-            pvalues[model_type[1]][metric] = pvalue
-            
-            fed_samples[model_type[0]][metric] = samples_2.copy()
-            
-            
-    for metric in init_val_inhouse_only_df[BINARY_DICE].unique():
-        stat, pvalue = scipy.stats.wilcoxon(fed_samples["Preliminary Federation Consensus"][metric], 
-                                            fed_samples["Full Federation Consensus"][metric])        
-        pvalues["Preliminary consens vs full consens"][metric] = pvalue       
+    comparisons = {("Public Initial Model", "Preliminary Federation Consensus"): "init vs Preliminary federation consensus", 
+                ("Public Initial Model", "Full Federation Consensus"): "init vs Full federation consensus", 
+                ("Preliminary Federation Consensus", "Full Federation Consensus"): "Preliminary consens vs full consens"}
+    tests = paired_wilcoxon(df=temp_df, 
+                            model_column="Model Type", 
+                            region_column=BINARY_DICE, 
+                            value_column=DICE_OR_JACCARD, 
+                            comparisons=list(comparisons), 
+                            regions=init_val_inhouse_only_df[BINARY_DICE].unique())
+    pvalues = {name: {} for name in comparisons.values()}
+    for model_1, model_2, metric, pvalue in tests[['model_1', 'model_2', BINARY_DICE, 'pvalue']].itertuples(index=False):
+        pvalues[comparisons[(model_1, model_2)]][metric] = pvalue
             
             
             
@@ -124,7 +109,7 @@ def main(data_pardir, output_pardir, jaccard):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
     parser.add_argument('--jaccard', '-j', action='store_true', help='Whether or not to convert DICE scores to Jaccard index.')  
     args = parser.parse_args()
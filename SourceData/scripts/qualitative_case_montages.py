@@ -0,0 +1,43 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import argparse, os
+from glob import glob
+
+import matplotlib.pyplot as plt
+
+from fets_paper_figures import case_slices, render_case_montage, save_at_dpi
+
+def main(cases_dir, output_pardir, background, disagreement_weight):
+
+    # the selected slices are cached next to the figures, so later runs only redraw
+    cache_dir = os.path.join(output_pardir, 'montage_slices')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    for case_dir in sorted(glob(os.path.join(cases_dir, '*', ''))):
+        slices = case_slices(case_dir, cache_dir=cache_dir, disagreement_weight=disagreement_weight)
+        render_case_montage(slices, background=background)
+        fpath = os.path.join(output_pardir, os.path.basename(os.path.normpath(case_dir)) + '_montage.png')
+        print(f"Saving montage of {slices['subject']} (axial slice {slices['z']}) at: {fpath}\n")
+        save_at_dpi(fpath, dpi=300)
+        plt.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases_dir', '-cd', type=str, help='Absolute path to the folder holding the case folders.', default="../../QualitativeExamples")
+    parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
+    parser.add_argument('--background', '-b', type=str, default='flair', help='Modality the segmentations are overlaid on.')
+    parser.add_argument('--disagreement_weight', '-dw', type=float, default=1.0,
+                        help='Weight of the prediction versus ground truth disagreement against the tumor area when picking the slice.')
+    args = parser.parse_args()
+    main(**vars(args))
@@ -0,0 +1,40 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import argparse, os
+
+from fets_paper_figures import score_cases, holdout_frame
+
+def main(cases_dir, output_pardir, models, n_jobs, output_fname, surface_distances):
+
+    scores = score_cases(root_dir=cases_dir,
+                         output_dir=os.path.join(output_pardir, output_fname + '_parts'),
+                         models=models,
+                         n_jobs=n_jobs,
+                         with_surface_distances=surface_distances)
+
+    fpath = os.path.join(output_pardir, output_fname + '.csv')
+    print(f"Saving scores of {len(scores)} case segmentations at: {fpath}\n")
+    holdout_frame(scores).to_csv(fpath, index=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases_dir', '-cd', type=str, help='Absolute path to the folder holding the case folders (named as in QualitativeExamples).', default="../../QualitativeExamples")
+    parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
+    parser.add_argument('--models', '-m', type=str, nargs='+', default=None, help='Only score the segmentations of these models (all found by default).')
+    parser.add_argument('--n_jobs', '-nj', type=int, default=1, help='Number of processes to score cases with.')
+    parser.add_argument('--output_fname', '-of', type=str, default='case_scores',
+                        help='Name of the output csv (without extension). Rerunning with the same name resumes from the scores already saved.')
+    parser.add_argument('--surface_distances', '-sd', action='store_true', help='Also compute the HD95 and ASSD boundary metrics of every region.')
+    args = parser.parse_args()
+    main(**vars(args))
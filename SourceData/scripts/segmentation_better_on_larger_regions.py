@@ -13,17 +13,19 @@
 import argparse
 import os
 
+import matplotlib.pyplot as plt
 import pandas as pd
 
-from fets_paper_figures import prep_plots, curvepermetric_value_over_rounds, JACCARD, IN_DF_JACCARD, DICE, IN_DF_DICE    
+from fets_paper_figures import prep_plots, curvepermetric_value_over_rounds, JACCARD, IN_DF_JACCARD, DICE, IN_DF_DICE, read_source_csv
+from fets_paper_figures import curvepermetric_value_over_volume, region_volumes, join_region_volumes, binned_value_over_volume, VOLUME
 
 
 
-def main(data_pardir, output_pardir, jaccard):    
+def main(data_pardir, output_pardir, jaccard, case_scores_fpath, cases_dir, n_bins, n_jobs):    
     
     # Curve showing that the DICE (or jaccard) was generally higher for larger regions: WT > ET > TC
 
-    df = pd.read_csv(os.path.join(data_pardir, 'val_df_final.csv'))
+    df = read_source_csv(data_pardir, 'val_df_final.csv', compact=True)
 
     prep_plots()
 
@@ -52,11 +54,33 @@ def main(data_pardir, output_pardir, jaccard):
                                     metric_value_column_name=JACCARD_OR_DICE, 
                                     metric_name_column_name='Region Of Interest')
 
+    if case_scores_fpath is None:
+        return
+
+    # the same claim against the ground truth volume of every case region, from per case scores
+    # (as written by score_case_directories.py)
+    plt.close()
+    volumes = region_volumes(cases_dir, n_jobs=n_jobs)
+    scores = join_region_volumes(pd.read_csv(case_scores_fpath), volumes)
+    binned = binned_value_over_volume(scores, value_column=IN_DF_JACCARD_OR_DICE, n_bins=n_bins)
+    binned = binned.rename({IN_DF_JACCARD_OR_DICE: JACCARD_OR_DICE}, axis=1)
+
+    curvepermetric_value_over_volume(binned_df=binned,
+                                     metric_names=['WT', 'ET', 'TC'],
+                                     volume_column_name=VOLUME,
+                                     metric_value_column_name=JACCARD_OR_DICE,
+                                     fpath=os.path.join(output_pardir, JACCARD_OR_DICE + '_over_region_volume.pdf'),
+                                     custom_title='Holdout Cases by Region Volume')
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
     parser.add_argument('--jaccard', '-j', action='store_true', help='Whether or not to convert DICE scores to Jaccard index.')
+    parser.add_argument('--case_scores_fpath', '-cs', type=str, default=None, help='Absolute path to per case scores, to also plot the scores over region volumes.')
+    parser.add_argument('--cases_dir', '-cd', type=str, help='Absolute path to the folder holding the case folders of the per case scores.', default="../../QualitativeExamples")
+    parser.add_argument('--n_bins', '-nb', type=int, default=10, help='Number of region volume bins.')
+    parser.add_argument('--n_jobs', '-nj', type=int, default=1, help='Number of processes to read the ground truth volumes with.')
     args = parser.parse_args()
     main(**vars(args))
\ No newline at end of file
@@ -14,19 +14,15 @@
 import argparse
 import os
 
-import scipy
-import numpy as np
-import pandas as pd
-
-from fets_paper_figures import prep_plots, my_violin_plot, save_at_dpi, BINARY_DICE, DICE, JACCARD, dice_or_jaccard
+from fets_paper_figures import prep_plots, my_violin_plot, save_at_dpi, BINARY_DICE, DICE, dice_or_jaccard, read_source_csv, paired_wilcoxon
 
 
 def main(data_pardir, output_pardir, jaccard):
 
 
 
-    single_models_val_df = pd.read_csv(os.path.join(data_pardir, 'single_models_val_df.csv'))
-    consensus_model_results_inhouse_only_df = pd.read_csv(os.path.join(data_pardir, 'consensus_model_results_inhouse_only_df.csv'))
+    single_models_val_df = read_source_csv(data_pardir, 'single_models_val_df.csv')
+    consensus_model_results_inhouse_only_df = read_source_csv(data_pardir, 'consensus_model_results_inhouse_only_df.csv')
 
     new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, DICE_OR_JACCARD = dice_or_jaccard(jaccard)
     
@@ -75,13 +71,12 @@ def main(data_pardir, output_pardir, jaccard):
 
     pvalues.update({site + ' vs cons': {} for site in sites})
 
-    for metric in temp_df[BINARY_DICE].unique():
-        samples_1 = temp_df[(temp_df["Model Name"] == "G ensemble") & (temp_df[BINARY_DICE] == metric)][DICE_OR_JACCARD].values
-        samples_2 = temp_df[(temp_df["Model Name"] == 'Full Federation Consensus') & (temp_df[BINARY_DICE] == metric)][DICE_OR_JACCARD].values
-        stat, pvalue = scipy.stats.wilcoxon(samples_1, samples_2)
-        m1, m2 = np.mean(samples_1), np.mean(samples_2)
-        sd1, sd2 = np.std(samples_1), np.std(samples_2)
-        pvalues['ensemble vs cons'][metric] = pvalue 
+    tests = paired_wilcoxon(df=temp_df, 
+                            model_column="Model Name", 
+                            region_column=BINARY_DICE, 
+                            value_column=DICE_OR_JACCARD, 
+                            comparisons=[("G ensemble", 'Full Federation Consensus')])
+    pvalues['ensemble vs cons'] = dict(zip(tests[BINARY_DICE], tests['pvalue']))
         
     temp_df = temp_df.replace(to_replace='G ensemble', value='Ensemble')
     temp_df = temp_df.replace(to_replace='Institution 42', value='Site 3')
@@ -90,15 +85,13 @@ def main(data_pardir, output_pardir, jaccard):
     temp_df = temp_df.replace(to_replace='Institution 46', value='Site 1')
 
 
-    for site in sites:
-        for metric in temp_df[BINARY_DICE].unique():
-            samples_1 = temp_df[(temp_df["Model Name"] == site) & 
-                                (temp_df[BINARY_DICE] == metric) ][DICE].values
-            samples_2 = temp_df[(temp_df["Model Name"] == 'Full Federation Consensus') & (temp_df[BINARY_DICE] == metric)][DICE].values
-            stat, pvalue = scipy.stats.wilcoxon(samples_1, samples_2)
-            m1, m2 = np.mean(samples_1), np.mean(samples_2)
-            sd1, sd2 = np.std(samples_1), np.std(samples_2)
-            pvalues[site + ' vs cons'][metric] = pvalue
+    tests = paired_wilcoxon(df=temp_df, 
+                            model_column="Model Name", 
+                            region_column=BINARY_DICE, 
+                            value_column=DICE, 
+                            comparisons=[(site, 'Full Federation Consensus') for site in sites])
+    for site, metric, pvalue in tests[['model_1', BINARY_DICE, 'pvalue']].itertuples(index=False):
+        pvalues[site + ' vs cons'][metric] = pvalue
             
     sorting_dict = {'Full Federation Consensus': 0, 
                     'Ensemble': 1,
@@ -152,7 +145,7 @@ def main(data_pardir, output_pardir, jaccard):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
     parser.add_argument('--jaccard', '-j', action='store_true', help='Whether or not to convert DICE scores to Jaccard index.')
     args = parser.parse_args()
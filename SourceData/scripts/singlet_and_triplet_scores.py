@@ -11,23 +11,22 @@
 # limitations under the License.
 
 
-import argparse, os
-import pandas as pd
+import argparse
 
-from fets_paper_figures import JACCARD, IN_DF_JACCARD, DICE, IN_DF_DICE
+from fets_paper_figures import read_source_csv
 
 
 def main(data_pardir, jaccard):
     if jaccard:
-        sing_trip_results = pd.read_csv(os.path.join(data_pardir, 'singlet_and_triplet_jaccard_scores.csv'))
+        sing_trip_results = read_source_csv(data_pardir, 'singlet_and_triplet_jaccard_scores.csv')
     else:   
-        sing_trip_results = pd.read_csv(os.path.join(data_pardir, 'singlet_and_triplet_dice_scores.csv'))
+        sing_trip_results = read_source_csv(data_pardir, 'singlet_and_triplet_dice_scores.csv')
         
     print(sing_trip_results.style.to_latex())
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--jaccard', '-j', action='store_true', help='Whether or not to convert DICE scores to Jaccard index.')
     
     args = parser.parse_args()
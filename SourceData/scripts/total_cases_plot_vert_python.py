@@ -14,18 +14,16 @@
 import argparse
 import os
 
-import scipy
 import numpy as np
-import pandas as pd
 import seaborn as sns
 from matplotlib.pyplot import figure
 
-from fets_paper_figures import save_at_dpi, font_scale
+from fets_paper_figures import save_at_dpi, font_scale, read_source_csv
 
 
 def main(data_pardir, output_pardir):
 
-    total_cases_df = pd.read_csv(os.path.join(data_pardir, 'total_cases_df.csv'))
+    total_cases_df = read_source_csv(data_pardir, 'total_cases_df.csv')
 
     cases_name = 'Cases(total=6,314)'
 
@@ -112,7 +110,7 @@ def main(data_pardir, output_pardir):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory.', default="../")
+    parser.add_argument('--data_pardir', '-dp', type=str, help='Absolute path to the data parent directory, or to SourceData.tar itself.', default="../")
     parser.add_argument('--output_pardir', '-op', type=str, help='Absolute path to the output parent directory.', default="../../output")
     args = parser.parse_args()
     main(**vars(args))
\ No newline at end of file
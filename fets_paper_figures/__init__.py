@@ -11,8 +11,28 @@
 # limitations under the License.
 
 
-from .plotting import BINARY_DICE, DICE, IN_DF_DICE, JACCARD, IN_DF_JACCARD, my_violin_plot, prep_plots, other_font_size, interp_MBD_best_round
-from .plotting import curvepermetric_value_over_rounds, save_at_dpi, font_scale, value_label
+from .plotting import BINARY_DICE, DICE, IN_DF_DICE, JACCARD, IN_DF_JACCARD, IN_DF_HD95, HD95, IN_DF_ASSD, ASSD, my_violin_plot, prep_plots, other_font_size, interp_MBD_best_round, binned_violinplot
+from .plotting import curvepermetric_value_over_rounds, curvepermetric_value_over_volume, save_at_dpi, font_scale, value_label
 
-from .data_parsing_and_plotting import compute_increases, get_comparison_df_detailed
-from .data_parsing_and_plotting import aggregated_fine_grained_binary_dice_over_rounds, dice_or_jaccard
+from .data_parsing_and_plotting import compute_increases, get_comparison_df_detailed, compute_increases_all_rounds
+from .data_parsing_and_plotting import aggregated_fine_grained_binary_dice_over_rounds, dice_or_jaccard, metric_naming
+from .data_parsing_and_plotting import round_moments, mean_from_moments, envelope_from_moments, streamed_mean_over_rounds
+
+from .data_loading import load_csv, read_source_csv, TarDataSource, iter_csv_chunks, iter_source_chunks
+from .schema import compact_validation_frame, memory_savings
+from .metric_cube import MetricCube
+from .round_selection import BestRoundSelector, select_best_round, BEST_ROUND_CRITERIA
+from .validation_index import ValidationIndex
+from .reshaping import spread_columns_to_rows
+from .stats import batched_wilcoxon, paired_wilcoxon
+from .bootstrap import bootstrap_resample_means, bootstrap_mean_ci, bootstrap_percent_increase_ci
+from .permutation import sign_flip_test, pairwise_permutation_table
+from .nifti import read_nifti_header, iter_nifti_slabs, memmap_nifti, read_nifti, read_nifti_slice
+from .scoring import score_label_maps, score_case, score_case_dir, load_label_map, label_voxel_counts
+from .surface_distance import surface_distances, surface_distance_scores, score_case_surface_distances, case_surface_distance_scores
+from .lesion_metrics import lesion_overlaps, lesion_scores, lesion_wise_frames, lesion_wise_case_dir
+from .batch_scoring import discover_cases, score_cases, read_batch_scores, holdout_frame
+from .case_mining import improvement_frame, pick_quantile_cases, export_picked_cases
+from .montage import slice_scores, best_slice, case_slices, render_case_montage
+from .volumes import VOLUME, region_volume_frame, region_volumes, join_region_volumes, binned_value_over_volume
+from .downsampling import lttb_indices, downsample_curve, downsample_rounds
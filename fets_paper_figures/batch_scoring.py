@@ -0,0 +1,194 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .data_loading import write_cache_entry, read_entry
+from .plotting import BINARY_DICE, IN_DF_DICE, IN_DF_JACCARD, IN_DF_HD95, IN_DF_ASSD
+from .scoring import GROUND_TRUTH, REGIONS, SEG_SUFFIX, score_case_files
+from .surface_distance import case_surface_distance_scores
+
+
+PART_PREFIX = 'part-'
+DEFAULT_FLUSH_CASES = 50
+
+_SEG_FNAME = re.compile('^(?P<subject>.+)' + SEG_SUFFIX + r'(?P<model>[^.]+)\.nii(\.gz)?$')
+
+
+def discover_cases(root_dir, models=None):
+    """
+    List of (subject, ground truth path, {model: prediction path}) for every <subject>_seg_GroundTruth.nii[.gz]
+    under root_dir, with the <subject>_seg_<model>.nii[.gz] volumes of the same folder, as in QualitativeExamples.
+    models optionally restricts the predictions to those model names. Cases are sorted by subject.
+    """
+    cases = {}
+    for dirpath, dirnames, fnames in os.walk(root_dir):
+        dirnames.sort()
+        for fname in fnames:
+            match = _SEG_FNAME.match(fname)
+            if match is None:
+                continue
+            case = cases.setdefault((match.group('subject'), dirpath), {'gt': None, 'preds': {}})
+            model = match.group('model')
+            if model == GROUND_TRUTH:
+                case['gt'] = os.path.join(dirpath, fname)
+            elif models is None or model in models:
+                case['preds'][model] = os.path.join(dirpath, fname)
+
+    discovered = []
+    for (subject, dirpath), case in sorted(cases.items()):
+        if case['gt'] is None:
+            print(f"Skipping {subject} in {dirpath}, which has no {GROUND_TRUTH} segmentation.")
+            continue
+        discovered.append((subject, case['gt'], dict(sorted(case['preds'].items()))))
+    return discovered
+
+
+def _score_case(subject, gt_fpath, pred_fpaths, empty_score, with_surface_distances):
+    rows = score_case_files(subject, gt_fpath, pred_fpaths, empty_score=empty_score)
+    if with_surface_distances:
+        for row, distances in zip(rows, case_surface_distance_scores(gt_fpath, list(pred_fpaths.values()))):
+            row.update(distances)
+    return rows
+
+
+def _part_dirs(output_dir):
+    if not os.path.isdir(output_dir):
+        return []
+    return sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir) if name.startswith(PART_PREFIX))
+
+
+def _read_parts(output_dir):
+    parts = [(part_dir, read_entry(part_dir)) for part_dir in _part_dirs(output_dir)]
+    return [(part_dir, df) for part_dir, df in parts if df is not None]
+
+
+def read_batch_scores(output_dir):
+    """
+    All scores written so far by score_cases into output_dir, in the order they were written. A (subject, model)
+    scored again (e.g. with surface distances after a run without them) keeps its latest scores.
+    """
+    parts = _read_parts(output_dir)
+    if not parts:
+        return pd.DataFrame()
+    scores = pd.concat([df for _, df in parts], keys=range(len(parts))).drop_duplicates(['SubjectID', 'Model'], keep='last')
+
+    # parts written without some of the columns of the others leave those NaN in their rows
+    part_numbers = scores.index.get_level_values(0)
+    for part_number, (part_dir, part) in enumerate(parts):
+        missing = [column for column in scores.columns if column not in part.columns]
+        n_rows = int((part_numbers == part_number).sum())
+        if missing and n_rows:
+            print(f"{n_rows} scores in {part_dir} were written without {missing}, which are left NaN.")
+    return scores.reset_index(drop=True)
+
+
+def _write_part(rows, output_dir, part_number):
+    write_cache_entry(pd.DataFrame(rows),
+                      os.path.join(output_dir, f'{PART_PREFIX}{part_number:06d}'),
+                      signature={},
+                      content_hash=None)
+
+
+def _score_columns(with_surface_distances):
+    metrics = [IN_DF_DICE, IN_DF_JACCARD] + ([IN_DF_HD95, IN_DF_ASSD] if with_surface_distances else [])
+    return ['MeanBinary' + metric for metric in metrics]
+
+
+def _completed_results(pending):
+    # results in order of completion, each future leaving pending once its result is taken
+    for future in as_completed(list(pending)):
+        pending.discard(future)
+        yield future.result()
+
+
+def score_cases(root_dir, output_dir, models=None, n_jobs=1, flush_cases=DEFAULT_FLUSH_CASES, empty_score=1.0, with_surface_distances=False):
+    """
+    Score every case found under root_dir (see discover_cases) and return all scores as one frame with
+    SubjectID, Model and the val_df score columns (with the HD95 and ASSD ones if with_surface_distances).
+
+    Cases are scored across a process pool of n_jobs workers. Results stream into output_dir as append only
+    columnar parts (the .npy column format of the csv cache), one part per flush_cases finished cases, each
+    written to a temporary folder and renamed into place. An interrupted run therefore leaves only complete
+    parts, and running again skips every (subject, model) already in a part with the requested score columns,
+    scoring only what is missing (e.g. everything when surface distances are asked for the first time).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    score_columns = _score_columns(with_surface_distances)
+    done_keys = set()
+    for _, part in _read_parts(output_dir):
+        if all(column in part.columns for column in score_columns):
+            done_keys.update(zip(part['SubjectID'], part['Model']))
+
+    tasks = []
+    for subject, gt_fpath, pred_fpaths in discover_cases(root_dir, models=models):
+        missing = {model: fpath for model, fpath in pred_fpaths.items() if (subject, model) not in done_keys}
+        if missing:
+            tasks.append((subject, gt_fpath, missing))
+    print(f"{len(done_keys)} case segmentations already scored, scoring {sum(len(task[2]) for task in tasks)} more from {len(tasks)} cases.")
+
+    part_dirs = _part_dirs(output_dir)
+    part_number = int(os.path.basename(part_dirs[-1])[len(PART_PREFIX):]) + 1 if part_dirs else 0
+    rows, buffered_cases = [], 0
+    executor, pending = None, set()
+    try:
+        if n_jobs == 1:
+            results = (_score_case(*task, empty_score, with_surface_distances) for task in tasks)
+        else:
+            executor = ProcessPoolExecutor(max_workers=n_jobs)
+            pending = {executor.submit(_score_case, *task, empty_score, with_surface_distances) for task in tasks}
+            results = _completed_results(pending)
+        for case_rows in results:
+            rows.extend(case_rows)
+            buffered_cases += 1
+            if buffered_cases == flush_cases:
+                _write_part(rows, output_dir, part_number)
+                part_number += 1
+                rows, buffered_cases = [], 0
+    finally:
+        # keep whatever finished before an interruption or a failing case, including cases
+        # completed but not taken yet and the ones still running at the time
+        if executor is not None:
+            # cancelled by hand rather than with shutdown(cancel_futures=True), which needs Python 3.9
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    rows.extend(future.result())
+        if rows:
+            _write_part(rows, output_dir, part_number)
+
+    return read_batch_scores(output_dir)
+
+
+def holdout_frame(scores, model_column='Model Type'):
+    """
+    Long layout of the holdout csvs (e.g. final_consensus_val_df.csv): one row per case, model and
+    Tumor Sub-Compartment ('Average', 'WT', 'TC', 'ET'), with the DICE and JACCARD (and HD95 and ASSD
+    when scored) of that region.
+    """
+    metrics = [metric for metric in [IN_DF_DICE, IN_DF_JACCARD, IN_DF_HD95, IN_DF_ASSD] if 'MeanBinary' + metric in scores.columns]
+    frames = []
+    for region in ['Average'] + REGIONS:
+        frame = scores[['SubjectID', 'Model']].rename({'Model': model_column}, axis=1)
+        frame[BINARY_DICE] = region
+        for metric in metrics:
+            column = 'MeanBinary' + metric if region == 'Average' else 'binary_' + metric + '_' + region
+            frame[metric] = scores[column].values
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
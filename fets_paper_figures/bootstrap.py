@@ -0,0 +1,161 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .stats import paired_sample_matrix
+
+
+DEFAULT_RESAMPLES = 10000
+# bytes the [resample, case] arrays of one chunk of resamples may take, which sets the default chunk size
+CHUNK_BYTES = 256 * 2 ** 20
+# [resample, case] arrays alive at once while a chunk is resampled (indices, bincount input and counts, as float)
+_CHUNK_ARRAYS = 4
+
+
+def _resample_means_chunk(matrix, lengths, n_resamples, seed):
+    """
+    Means of n_resamples bootstrap resamples of every column of a NaN padded [case, column] matrix.
+
+    For every distinct column length L one [resample, L] array of resample indices is drawn and turned into
+    per case counts, so the resample sums of all columns of that length are one product of the counts with
+    those columns. All columns of the same length are resampled with the same cases: columns of paired
+    samples stay paired.
+    """
+    rng = np.random.default_rng(seed)
+    means = np.full((n_resamples, len(lengths)), np.nan)
+    for length in np.unique(lengths):
+        if length == 0:
+            continue
+        columns = np.flatnonzero(lengths == length)
+        indices = rng.integers(0, length, size=(n_resamples, length))
+        indices += np.arange(n_resamples)[:, None] * length
+        counts = np.bincount(indices.ravel(), minlength=n_resamples * length).reshape(n_resamples, length)
+        means[:, columns] = (counts @ matrix[:length, columns]) / length
+    return means
+
+
+def bootstrap_resample_means(matrix, lengths, n_resamples=DEFAULT_RESAMPLES, seed=0, n_jobs=1, chunk_resamples=None):
+    """
+    [resample, column] array of bootstrap means of the first lengths[j] values of every column j of matrix.
+
+    Resamples are drawn in chunks of chunk_resamples (by default as many as fit in CHUNK_BYTES for the
+    longest column), chunk k seeded with the k-th child of np.random.SeedSequence(seed), so the result
+    depends on seed and the chunk size but not on n_jobs. With n_jobs > 1 the chunks are spread across
+    a process pool, each worker holding one chunk at a time.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.intp)
+    if np.isnan(matrix[np.arange(matrix.shape[0])[:, None] < lengths[None, :]]).any():
+        raise ValueError('The samples have missing values, drop them before bootstrapping.')
+    if chunk_resamples is None:
+        chunk_resamples = max(CHUNK_BYTES // (_CHUNK_ARRAYS * 8 * max(int(lengths.max(initial=0)), 1)), 1)
+    chunk_sizes = [chunk_resamples] * (n_resamples // chunk_resamples)
+    if n_resamples % chunk_resamples:
+        chunk_sizes.append(n_resamples % chunk_resamples)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    if n_jobs == 1 or len(chunk_sizes) == 1:
+        chunks = [_resample_means_chunk(matrix, lengths, size, chunk_seed) for size, chunk_seed in zip(chunk_sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chunks = list(executor.map(_resample_means_chunk,
+                                       [matrix] * len(chunk_sizes),
+                                       [lengths] * len(chunk_sizes),
+                                       chunk_sizes,
+                                       seeds))
+    return np.concatenate(chunks, axis=0)
+
+
+def _percentile_interval(resampled, confidence):
+    alpha = 100 * (1 - confidence) / 2
+    return np.nanpercentile(resampled, [alpha, 100 - alpha], axis=0)
+
+
+def bootstrap_mean_ci(df, group_columns, value_column, n_resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=0, n_jobs=1):
+    """
+    Percentile bootstrap confidence interval of the mean of value_column for every group of df
+    (e.g. group_columns=['Model Type', 'Tumor Sub-Compartment']), all groups resampled at once.
+    Returns a frame with the group columns, mean, ci_low and ci_high, groups in order of appearance.
+    """
+    matrix, columns, lengths = paired_sample_matrix(df, group_columns, value_column)
+    resampled = bootstrap_resample_means(matrix, lengths, n_resamples=n_resamples, seed=seed, n_jobs=n_jobs)
+    low, high = _percentile_interval(resampled, confidence)
+
+    result = pd.DataFrame(list(columns), columns=group_columns)
+    result['mean'] = np.nansum(matrix, axis=0) / lengths
+    result['ci_low'] = low
+    result['ci_high'] = high
+    return result
+
+
+def bootstrap_percent_increase_ci(df,
+                                  model_column,
+                                  region_column,
+                                  value_column,
+                                  comparisons,
+                                  regions=None,
+                                  truncate=False,
+                                  n_resamples=DEFAULT_RESAMPLES,
+                                  confidence=0.95,
+                                  seed=0,
+                                  n_jobs=1):
+    """
+    Percentile bootstrap confidence interval of 100 * (mean_2 / mean_1 - 1), the percent increase of the
+    mean of model_2 over model_1 the scripts print, for every (model_1, model_2) in comparisons and every region.
+
+    Cases are paired by their order within each (model, region), as in paired_wilcoxon, and each resample
+    draws the same cases for both models. Unequal sample lengths raise a ValueError unless truncate is True,
+    in which case the extra cases of the longer sample are left out. Returns a frame with columns model_1,
+    model_2, region_column, percent_increase, ci_low and ci_high.
+    """
+    matrix, columns, lengths = paired_sample_matrix(df, [model_column, region_column], value_column)
+    if regions is None:
+        regions = list(pd.unique(df[region_column]))
+
+    rows, x_cols, y_cols, pair_lengths = [], [], [], []
+    for model_1, model_2 in comparisons:
+        for region in regions:
+            for model in (model_1, model_2):
+                if (model, region) not in columns:
+                    raise ValueError(f'There are no {value_column} values for {model} and {region}.')
+            x_col, y_col = columns[(model_1, region)], columns[(model_2, region)]
+            if not truncate and lengths[x_col] != lengths[y_col]:
+                raise ValueError(f'{model_1} has {lengths[x_col]} and {model_2} has {lengths[y_col]} {value_column} values for {region}, '
+                                 'the samples must be of the same length.')
+            rows.append((model_1, model_2, region))
+            x_cols.append(x_col)
+            y_cols.append(y_col)
+            pair_lengths.append(min(lengths[x_col], lengths[y_col]))
+
+    # model_1 samples then model_2 samples, so that each pair shares its resample indices
+    pair_lengths = np.asarray(pair_lengths * 2, dtype=np.intp)
+    pair_matrix = matrix[:, x_cols + y_cols]
+    resampled = bootstrap_resample_means(pair_matrix, pair_lengths, n_resamples=n_resamples, seed=seed, n_jobs=n_jobs)
+
+    n_pairs = len(rows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        resampled_increase = 100 * (resampled[:, n_pairs:] / resampled[:, :n_pairs] - 1)
+        in_sample = np.arange(matrix.shape[0])[:, None] < pair_lengths[None, :]
+        means = np.where(in_sample, pair_matrix, 0.0).sum(axis=0) / pair_lengths
+        increase = 100 * (means[n_pairs:] / means[:n_pairs] - 1)
+    low, high = _percentile_interval(resampled_increase, confidence)
+
+    result = pd.DataFrame(rows, columns=['model_1', 'model_2', region_column])
+    result['percent_increase'] = increase
+    result['ci_low'] = low
+    result['ci_high'] = high
+    return result
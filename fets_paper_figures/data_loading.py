@@ -0,0 +1,488 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .schema import compact_validation_frame
+
+
+CACHE_DIRNAME = '.fets_cache'
+SOURCE_DATA_TAR = 'SourceData.tar'
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_CHUNKSIZE = 1000000
+
+_META_FNAME = 'meta.json'
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def stream_sha256(f):
+    """
+    Content hash of an open binary stream, read in blocks so large csvs are never fully held in memory.
+    """
+    sha = hashlib.sha256()
+    for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+        sha.update(block)
+    return sha.hexdigest()
+
+
+def file_sha256(fpath):
+    with open(fpath, 'rb') as f:
+        return stream_sha256(f)
+
+
+def default_cache_dir(fpath):
+    return os.path.join(os.path.dirname(os.path.abspath(fpath)), CACHE_DIRNAME)
+
+
+def cache_entry_dir(fpath, cache_dir=None, tag=''):
+    """
+    Directory holding the columnar copy of fpath. One entry per (absolute source path, tag).
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(fpath)
+    abspath = os.path.abspath(fpath)
+    path_key = hashlib.sha1((abspath + '|' + tag).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, os.path.basename(fpath) + '.' + path_key)
+
+
+def _read_meta(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, _META_FNAME), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format_version') != CACHE_FORMAT_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(entry_dir, meta):
+    # write then rename so a reader never sees a half written meta file
+    tmp_path = os.path.join(entry_dir, _META_FNAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(entry_dir, _META_FNAME))
+
+
+def source_signature(fpath):
+    stat = os.stat(fpath)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def valid_cache_meta(entry_dir, signature, hash_fn):
+    """
+    Return the cache meta if the cached columns still describe the source, otherwise None.
+
+    signature holds the source's size and mtime_ns, which are checked first. When only the mtime
+    moved (a touch, a fresh checkout, a copy) the content hash returned by hash_fn() decides, and a
+    matching entry has its stored mtime refreshed so the next call is back to a stat only check.
+    """
+    meta = _read_meta(entry_dir)
+    if meta is None:
+        return None
+    if meta['size'] != signature['size']:
+        return None
+    if meta['mtime_ns'] == signature['mtime_ns']:
+        return meta
+    if hash_fn() != meta['sha256']:
+        return None
+    meta['mtime_ns'] = signature['mtime_ns']
+    try:
+        _write_meta(entry_dir, meta)
+    except OSError:
+        pass
+    return meta
+
+
+# python types an object column's unique values may have, tagged in the column meta when they
+# are not all strings so that e.g. a True/False/NaN column does not come back as 'True'/'False'
+_CATEGORY_TYPES = [('b', (bool, np.bool_), lambda v: v == 'True'),
+                   ('i', (int, np.integer), int),
+                   ('f', (float, np.floating), float),
+                   ('s', (str,), str)]
+
+
+def _category_type(category):
+    for tag, types, _ in _CATEGORY_TYPES:
+        if isinstance(category, types):
+            return tag
+    raise ValueError(f'Cannot cache values of type {type(category).__name__} without pickling them.')
+
+
+def _restore_categories(categories, category_types):
+    parsers = {tag: parse for tag, _, parse in _CATEGORY_TYPES}
+    return np.array([parsers[tag](value) for tag, value in zip(category_types, categories)], dtype=object)
+
+
+def _encode_column(values, entry_dir, idx):
+    """
+    Save one column as .npy files. Strings are stored as integer codes plus a unicode array of
+    the unique values, so nothing needs pickling. Unique values that are not all strings (bools,
+    numbers mixed with text) are stored as their str with a per value type tag in the column meta.
+    """
+    col_meta = {}
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.values
+        categories = values.cat.categories.values
+        col_meta['kind'] = 'categorical'
+        col_meta['ordered'] = bool(values.cat.ordered)
+    elif values.dtype.kind in 'biufc':
+        np.save(os.path.join(entry_dir, f'col_{idx}.npy'), values.values)
+        col_meta['kind'] = 'numeric'
+        return col_meta
+    else:
+        codes, categories = pd.factorize(values, sort=False)
+        categories = np.asarray(categories)
+        col_meta['kind'] = 'object'
+
+    if categories.dtype == object:
+        category_types = ''.join(_category_type(c) for c in categories)
+        if category_types.strip('s'):
+            col_meta['category_types'] = category_types
+        categories = np.array([str(c) for c in categories], dtype=str)
+    codes = codes.astype(np.min_scalar_type(-max(len(categories), 1)), copy=False)
+    np.save(os.path.join(entry_dir, f'col_{idx}.npy'), codes)
+    np.save(os.path.join(entry_dir, f'col_{idx}_categories.npy'), categories)
+    return col_meta
+
+
+def _open_column(entry_dir, idx, col_meta, mmap_mode=None):
+    values = np.load(os.path.join(entry_dir, f'col_{idx}.npy'), mmap_mode=mmap_mode)
+    if col_meta['kind'] == 'numeric':
+        return values, None
+    categories = np.load(os.path.join(entry_dir, f'col_{idx}_categories.npy'))
+    if 'category_types' in col_meta:
+        categories = _restore_categories(categories, col_meta['category_types'])
+    return values, categories
+
+
+def _decode_values(col_meta, values, categories):
+    if col_meta['kind'] == 'numeric':
+        return np.asarray(values)
+    if col_meta['kind'] == 'categorical':
+        return pd.Categorical.from_codes(values, categories=categories, ordered=col_meta['ordered'])
+    # object columns come back exactly as read_csv returns them: python objects with NaN for missing
+    lookup = np.append(categories.astype(object), np.nan)
+    return lookup[values]
+
+
+def write_cache_entry(df, entry_dir, signature, content_hash):
+    """
+    Write df column by column into entry_dir (replacing any previous entry).
+    """
+    parent = os.path.dirname(entry_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp_')
+    try:
+        os.chmod(tmp_dir, 0o755)
+        columns = []
+        for idx, name in enumerate(df.columns):
+            col_meta = _encode_column(df.iloc[:, idx], tmp_dir, idx)
+            col_meta['name'] = name
+            columns.append(col_meta)
+        meta = {'format_version': CACHE_FORMAT_VERSION,
+                'nrows': len(df),
+                'columns': columns,
+                'sha256': content_hash}
+        meta.update(signature)
+        _write_meta(tmp_dir, meta)
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.replace(tmp_dir, entry_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _entry_column_indices(meta, columns):
+    available = [col_meta['name'] for col_meta in meta['columns']]
+    if columns is None:
+        columns = available
+    missing = [name for name in columns if name not in available]
+    if missing:
+        raise ValueError(f'Columns {missing} are not in the cached columns {available}.')
+    return columns, [available.index(name) for name in columns]
+
+
+def read_cache_entry(entry_dir, meta, columns=None):
+    """
+    Rebuild a DataFrame (optionally only some columns) from a cache entry.
+    """
+    columns, indices = _entry_column_indices(meta, columns)
+    data = {}
+    for name, idx in zip(columns, indices):
+        col_meta = meta['columns'][idx]
+        values, categories = _open_column(entry_dir, idx, col_meta)
+        data[name] = _decode_values(col_meta, values, categories)
+    return pd.DataFrame(data, columns=columns)
+
+
+def read_entry(entry_dir, columns=None):
+    """
+    DataFrame of a columnar entry written by write_cache_entry, or None if there is no readable entry.
+    """
+    meta = _read_meta(entry_dir)
+    if meta is None:
+        return None
+    return read_cache_entry(entry_dir, meta, columns=columns)
+
+
+def iter_cache_entry_chunks(entry_dir, meta, columns=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield consecutive row slices of a cache entry as DataFrames. The columns are memory mapped, so
+    only one chunk at a time is ever read into memory.
+    """
+    columns, indices = _entry_column_indices(meta, columns)
+    opened = [_open_column(entry_dir, idx, meta['columns'][idx], mmap_mode='r') for idx in indices]
+    for start in range(0, meta['nrows'], chunksize):
+        data = {}
+        for name, idx, (values, categories) in zip(columns, indices, opened):
+            data[name] = _decode_values(meta['columns'][idx], values[start:start + chunksize], categories)
+        yield pd.DataFrame(data, columns=columns, index=pd.RangeIndex(start, start + len(data[columns[0]])))
+
+
+def cached_frame(entry_dir, signature, hash_fn, parse_fn, columns=None):
+    """
+    Shared cache logic of load_csv and TarDataSource.read_csv: return the cached frame if the
+    entry is still valid, otherwise call parse_fn() and (re)write the entry.
+    """
+    hashes = []
+    def memo_hash_fn():
+        if not hashes:
+            hashes.append(hash_fn())
+        return hashes[0]
+
+    meta = valid_cache_meta(entry_dir, signature=signature, hash_fn=memo_hash_fn)
+    if meta is not None:
+        return read_cache_entry(entry_dir, meta, columns=columns)
+
+    content_hash = memo_hash_fn()
+    df = parse_fn()
+    try:
+        write_cache_entry(df, entry_dir, signature=signature, content_hash=content_hash)
+    except (OSError, ValueError) as e:
+        # a read only data directory or values the cache cannot store should not stop the scripts from working
+        print(f"Could not write csv cache at {entry_dir}: {e}")
+    return df if columns is None else df[columns]
+
+
+_CACHE_TAGS = ['', 'compact', 'compact_float32']
+
+
+def _cache_tag(compact, float32_metrics):
+    if not compact:
+        return ''
+    return 'compact_float32' if float32_metrics else 'compact'
+
+
+def _iter_chunks(entry_fpath, cache_dir, signature, hash_fn, open_fn, columns, chunksize):
+    """
+    Chunks from whichever valid cache entry exists for the source (plain or compact), falling back
+    to a chunked pd.read_csv of the text when the source has not been cached yet.
+    """
+    for tag in _CACHE_TAGS:
+        entry_dir = cache_entry_dir(entry_fpath, cache_dir=cache_dir, tag=tag)
+        meta = valid_cache_meta(entry_dir, signature=signature, hash_fn=hash_fn)
+        if meta is not None:
+            yield from iter_cache_entry_chunks(entry_dir, meta, columns=columns, chunksize=chunksize)
+            return
+    with open_fn() as f:
+        yield from pd.read_csv(f, usecols=columns, chunksize=chunksize)
+
+
+def _parse_csv(source, compact, float32_metrics):
+    df = pd.read_csv(source)
+    if compact:
+        df = compact_validation_frame(df, float32_metrics=float32_metrics)
+    return df
+
+
+def load_csv(fpath, cache_dir=None, columns=None, use_cache=True, compact=False, float32_metrics=False):
+    """
+    Drop in replacement for pd.read_csv(fpath) that keeps a columnar binary copy of the parsed csv.
+
+    The copy lives in cache_dir (by default a '.fets_cache' folder next to the csv) and is keyed on
+    the csv's size, mtime and sha256, so the text is only parsed again when the source changes.
+    columns restricts which columns are read back from the cache. With compact set the frame is
+    passed through compact_validation_frame before caching (see schema.py), and the compact copy
+    is cached separately from the plain one.
+    """
+    parse_fn = lambda: _parse_csv(fpath, compact=compact, float32_metrics=float32_metrics)
+    if not use_cache:
+        df = parse_fn()
+        return df if columns is None else df[columns]
+
+    entry_dir = cache_entry_dir(fpath, cache_dir=cache_dir, tag=_cache_tag(compact, float32_metrics))
+    return cached_frame(entry_dir, 
+                        signature=source_signature(fpath), 
+                        hash_fn=lambda: file_sha256(fpath), 
+                        parse_fn=parse_fn, 
+                        columns=columns)
+
+
+def iter_csv_chunks(fpath, columns=None, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None):
+    """
+    Read a csv as a sequence of DataFrames of at most chunksize rows, for sources that do not fit
+    in memory. The cached columnar copy is used when one is valid, so the text is not parsed.
+    """
+    return _iter_chunks(fpath, 
+                        cache_dir=cache_dir, 
+                        signature=source_signature(fpath), 
+                        hash_fn=lambda: file_sha256(fpath), 
+                        open_fn=lambda: open(fpath, 'rb'), 
+                        columns=columns, 
+                        chunksize=chunksize)
+
+
+class TarDataSource(object):
+    """
+    Read the source csvs straight out of SourceData.tar, without extracting the archive.
+
+    The member headers are indexed once when the source is created. Members are then streamed
+    into pandas on demand (no temporary files), and are looked up either by their full name in
+    the archive or by their basename.
+    """
+
+    def __init__(self, tar_path, cache_dir=None):
+        self.tar_path = os.path.abspath(tar_path)
+        if cache_dir is None:
+            cache_dir = default_cache_dir(self.tar_path)
+        self.cache_dir = cache_dir
+        self._tar = tarfile.open(self.tar_path, mode='r:*')
+        self.members = {}
+        for member in self._tar.getmembers():
+            if not member.isfile():
+                continue
+            self.members[member.name] = member
+            # full names win over basenames if two members share a basename
+            self.members.setdefault(os.path.basename(member.name), member)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def _member(self, name):
+        try:
+            return self.members[name]
+        except KeyError:
+            raise ValueError(f'{name} is not a member of {self.tar_path}.')
+
+    def open(self, name):
+        """
+        File object streaming the member's bytes from the archive.
+        """
+        return self._tar.extractfile(self._member(name))
+
+    def read_csv(self, name, columns=None, use_cache=True, compact=False, float32_metrics=False):
+        """
+        Same as load_csv, for a member of the archive.
+        """
+        member = self._member(name)
+
+        def parse_fn():
+            with self.open(name) as f:
+                return _parse_csv(f, compact=compact, float32_metrics=float32_metrics)
+
+        if not use_cache:
+            df = parse_fn()
+            return df if columns is None else df[columns]
+
+        def hash_fn():
+            with self.open(name) as f:
+                return stream_sha256(f)
+
+        entry_dir = cache_entry_dir(os.path.join(self.tar_path, member.name), 
+                                    cache_dir=self.cache_dir, 
+                                    tag=_cache_tag(compact, float32_metrics))
+        return cached_frame(entry_dir, 
+                            signature={'size': member.size, 'mtime_ns': int(member.mtime * 10**9)}, 
+                            hash_fn=hash_fn, 
+                            parse_fn=parse_fn, 
+                            columns=columns)
+
+    def iter_chunks(self, name, columns=None, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Same as iter_csv_chunks, for a member of the archive.
+        """
+        member = self._member(name)
+
+        def hash_fn():
+            with self.open(name) as f:
+                return stream_sha256(f)
+
+        return _iter_chunks(os.path.join(self.tar_path, member.name), 
+                            cache_dir=self.cache_dir, 
+                            signature={'size': member.size, 'mtime_ns': int(member.mtime * 10**9)}, 
+                            hash_fn=hash_fn, 
+                            open_fn=lambda: self.open(name), 
+                            columns=columns, 
+                            chunksize=chunksize)
+
+    def close(self):
+        self._tar.close()
+
+
+_tar_sources = {}
+
+
+def open_tar_source(tar_path):
+    """
+    TarDataSource for tar_path, indexed once per process.
+    """
+    key = os.path.abspath(tar_path)
+    if key not in _tar_sources:
+        _tar_sources[key] = TarDataSource(key)
+    return _tar_sources[key]
+
+
+def _resolve_source(data_pardir, fname):
+    """
+    (tar source or None, path of the csv) for one of the source csvs given the scripts' --data_pardir.
+    """
+    if os.path.isfile(data_pardir) and tarfile.is_tarfile(data_pardir):
+        return open_tar_source(data_pardir), fname
+    fpath = os.path.join(data_pardir, fname)
+    tar_path = os.path.join(data_pardir, SOURCE_DATA_TAR)
+    if not os.path.exists(fpath) and os.path.isfile(tar_path):
+        return open_tar_source(tar_path), fname
+    return None, fpath
+
+
+def read_source_csv(data_pardir, fname, **kwargs):
+    """
+    Read one of the source csvs given the scripts' --data_pardir, which can either be the directory
+    holding the extracted csvs or the path of SourceData.tar itself. A directory that holds a not yet
+    extracted SourceData.tar is read through the archive as well. kwargs are passed on to load_csv.
+    """
+    tar_source, fpath = _resolve_source(data_pardir, fname)
+    if tar_source is not None:
+        return tar_source.read_csv(fpath, **kwargs)
+    return load_csv(fpath, **kwargs)
+
+
+def iter_source_chunks(data_pardir, fname, **kwargs):
+    """
+    Chunked counterpart of read_source_csv; kwargs are passed on to iter_csv_chunks.
+    """
+    tar_source, fpath = _resolve_source(data_pardir, fname)
+    if tar_source is not None:
+        return tar_source.iter_chunks(fpath, **kwargs)
+    return iter_csv_chunks(fpath, **kwargs)
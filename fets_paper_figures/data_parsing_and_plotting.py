@@ -11,26 +11,41 @@
 # limitations under the License.
 
 
+import numpy as np
 import pandas as pd
+import scipy.stats
 import matplotlib.pyplot as plt
 
-from .plotting import save_at_dpi, DICE, IN_DF_DICE, IN_DF_JACCARD, JACCARD
+from .plotting import save_at_dpi, _default_ymax, DICE, IN_DF_DICE, IN_DF_JACCARD, JACCARD, IN_DF_HD95, HD95, IN_DF_ASSD, ASSD
+from .data_loading import iter_csv_chunks, DEFAULT_CHUNKSIZE
+from .metric_cube import MetricCube, nan_mean
+from .validation_index import ValidationIndex
+from .reshaping import spread_columns_to_rows
+from .downsampling import downsample_curve, downsample_rounds
 import seaborn as sns
 
 
-def dice_or_jaccard(jaccard):
+ROUND_GROUP_KEYS = ['ModelVersion', 'TaskName']
 
-    if jaccard:
-        IN_DF_DICE_OR_JACCARD = IN_DF_JACCARD
-        DICE_OR_JACCARD = JACCARD
-    else:
-        IN_DF_DICE_OR_JACCARD = IN_DF_DICE
-        DICE_OR_JACCARD = DICE
+# name used in the data -> name used on plots
+METRIC_DISPLAY_NAMES = {IN_DF_DICE: DICE, 
+                        IN_DF_JACCARD: JACCARD, 
+                        IN_DF_HD95: HD95, 
+                        IN_DF_ASSD: ASSD}
+
+
+def metric_naming(in_df_metric):
+    """
+    Same as dice_or_jaccard for any per region metric of METRIC_DISPLAY_NAMES (e.g. IN_DF_HD95), whose
+    columns follow the MeanBinary<metric>, binary_<metric>_<region> naming.
+    """
+    if in_df_metric not in METRIC_DISPLAY_NAMES:
+        raise ValueError(f'in_df_metric must be one of {list(METRIC_DISPLAY_NAMES)}, got {in_df_metric}.')
 
-    metrics = ['MeanBinary' + IN_DF_DICE_OR_JACCARD, 
-               'binary_' + IN_DF_DICE_OR_JACCARD + '_WT', 
-               'binary_' + IN_DF_DICE_OR_JACCARD + '_TC', 
-               'binary_' + IN_DF_DICE_OR_JACCARD + '_ET'] 
+    metrics = ['MeanBinary' + in_df_metric, 
+               'binary_' + in_df_metric + '_WT', 
+               'binary_' + in_df_metric + '_TC', 
+               'binary_' + in_df_metric + '_ET'] 
 
 
     region_label_dict = {metrics[0]: "Average",
@@ -40,56 +55,96 @@ def dice_or_jaccard(jaccard):
 
     new_metric_names = [region_label_dict[metric] for metric in metrics]
 
-    return new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, DICE_OR_JACCARD
-
+    return new_metric_names, metrics, region_label_dict, in_df_metric, METRIC_DISPLAY_NAMES[in_df_metric]
 
-def spread_metrics_across_rows(df, jaccard):
 
-    new_metric_names, _, region_label_dict, IN_DF_DICE_OR_JACCARD, _ = dice_or_jaccard(jaccard)
-    
-    temp_df = df.copy()
-    
-    # convert the metric names to new ones
-    temp_df = temp_df.rename(region_label_dict, axis=1)
-    
-    # restrict to only metric names columns, with model version as the index
-    temp_df = temp_df[['ModelVersion'] + new_metric_names].set_index(['ModelVersion'])
+def dice_or_jaccard(jaccard):
 
-    # create two level of columns to put all columns (metrics) under a top level : 'DICE'
-    temp_df.columns = pd.MultiIndex.from_tuples([(IN_DF_DICE_OR_JACCARD, metric) for metric in new_metric_names])
+    if jaccard:
+        return metric_naming(IN_DF_JACCARD)
+    else:
+        return metric_naming(IN_DF_DICE)
 
-    # now stack the dataframe
-    final_df = temp_df.stack()
-    # Move the model version back out of the index
-    final_df = final_df.reset_index()
 
-    # At this point, final_df should have exactly three columns 'ModelVersion', 'level_1', and 'DICE'.
-    # The level_1 column will contain the string of which metric applies, and the DICE holds the value.
+def spread_metrics_across_rows(df, jaccard, metric=None):
+    """
+    metric optionally selects another per region metric than DICE or JACCARD (see metric_naming), e.g. IN_DF_HD95.
+    """
 
-    # renaming the level_1 column
-    final_df = final_df.rename(mapper={'level_1': 'Tumor Sub-Compartment'}, axis=1)
+    if metric is None:
+        new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, _ = dice_or_jaccard(jaccard)
+    else:
+        new_metric_names, metrics, region_label_dict, IN_DF_DICE_OR_JACCARD, _ = metric_naming(metric)
+
+    # the metric columns may already carry their region names
+    value_columns = [column if column in df.columns else region_label_dict[column] for column in metrics]
+
+    # one row per (ModelVersion row, metric), with the region name in 'Tumor Sub-Compartment' and the value in 'DICE'
+    final_df = spread_columns_to_rows(df, 
+                                      id_column='ModelVersion', 
+                                      value_columns=value_columns, 
+                                      value_name=IN_DF_DICE_OR_JACCARD, 
+                                      name_column='Tumor Sub-Compartment', 
+                                      names=new_metric_names)
     
     return final_df
 
 
 def get_comparison_df_detailed (model_round, df, jaccard):
 
-    temp_df = df[df['TaskName']=='shared_model_validation']
+    if isinstance(df, MetricCube):
+        version_df = df.round_frame(model_round)
+        init_df = df.round_frame(0)
+        print(f"length of init df is {len(init_df)}")
+        return spread_metrics_across_rows(version_df, jaccard=jaccard), spread_metrics_across_rows(init_df, jaccard=jaccard)
 
-    version_df = temp_df[temp_df['ModelVersion']==model_round]
-    init_df = temp_df[temp_df['ModelVersion']==0]
+    if isinstance(df, ValidationIndex):
+        version_df = df.rows('shared_model_validation', model_round)
+        init_df = df.rows('shared_model_validation', 0)
+    else:
+        temp_df = df[df['TaskName']=='shared_model_validation']
+
+        version_df = temp_df[temp_df['ModelVersion']==model_round]
+        init_df = temp_df[temp_df['ModelVersion']==0]
     
     print(f"length of init df is {len(init_df)}")
     
     return spread_metrics_across_rows(version_df, jaccard=jaccard), spread_metrics_across_rows(init_df, jaccard=jaccard)
 
 
+def _compute_increases_from_cube(model_round, cube, jaccard):
+
+    _, metrics, _, _, _ = dice_or_jaccard(jaccard)
+    m_idx = [cube.position('metric', metric) for metric in metrics]
+
+    v_values = cube.round(model_round)[:, m_idx]
+    init_values = cube.round(0)[:, m_idx]
+    restricted_init_values = init_values[cube.present_in_round(model_round)]
+
+    vmodel_means = nan_mean(v_values, axis=0)
+    init_means = nan_mean(init_values, axis=0)
+    restricted_init_means = nan_mean(restricted_init_values, axis=0)
+
+    vmodel_score = dict(zip(metrics, vmodel_means))
+    init_score = dict(zip(metrics, init_means))
+    restricted_init_score = dict(zip(metrics, restricted_init_means))
+    percent_increase_restricted = {metric: int(round(100 * (vmodel_score[metric]/restricted_init_score[metric]-1))) for metric in metrics}
+    return  vmodel_score, init_score, restricted_init_score, percent_increase_restricted
+
+
 def compute_increases(model_round, df, jaccard):
+
+    if isinstance(df, MetricCube):
+        return _compute_increases_from_cube(model_round=model_round, cube=df, jaccard=jaccard)
     
-    temp_df = df[df['TaskName']=='shared_model_validation']
+    if isinstance(df, ValidationIndex):
+        v_df = df.rows('shared_model_validation', model_round)
+        init_df = df.rows('shared_model_validation', 0)
+    else:
+        temp_df = df[df['TaskName']=='shared_model_validation']
 
-    v_df = temp_df[temp_df['ModelVersion']==model_round]
-    init_df = temp_df[temp_df['ModelVersion']==0]
+        v_df = temp_df[temp_df['ModelVersion']==model_round]
+        init_df = temp_df[temp_df['ModelVersion']==0]
 
 
     vmodel_score = {}
@@ -111,26 +166,104 @@ def compute_increases(model_round, df, jaccard):
     return  vmodel_score, init_score, restricted_init_score, percent_increase_restricted
 
 
+def _increases_frame(rounds, metrics, vmodel_means, init_means, restricted_init_means):
+    """
+    Long frame, one row per (round, metric), from [round, metric] arrays of scores.
+    """
+    n_rounds, n_metrics = len(rounds), len(metrics)
+    increases_df = pd.DataFrame({'ModelVersion': np.repeat(np.asarray(rounds), n_metrics), 
+                                 'Metric': np.tile(np.asarray(metrics, dtype=object), n_rounds), 
+                                 'vmodel_score': np.asarray(vmodel_means).ravel(), 
+                                 'init_score': np.tile(np.asarray(init_means), n_rounds), 
+                                 'restricted_init_score': np.asarray(restricted_init_means).ravel()})
+    increases_df['percent_increase_restricted'] = 100 * (increases_df['vmodel_score'] / increases_df['restricted_init_score'] - 1)
+    return increases_df
+
+
+def compute_increases_all_rounds(df, jaccard):
+    """
+    compute_increases for every round at once. Returns a long frame with columns ModelVersion, Metric,
+    vmodel_score, init_score, restricted_init_score and percent_increase_restricted (not rounded, unlike
+    compute_increases).
+
+    The restricted init means come from per collaborator sums and counts of the round 0 scores,
+    merged onto the (round, collaborator) pairs and summed per round, instead of one isin filter per round.
+    df can also be a MetricCube, in which case the restricted means are a single matrix product of the
+    [round, collaborator] presence mask with the round 0 scores.
+    """
+    _, metrics, _, _, _ = dice_or_jaccard(jaccard)
+
+    if isinstance(df, MetricCube):
+        m_idx = [df.position('metric', metric) for metric in metrics]
+        values = df.values[:, :, m_idx]
+        init_values = df.round(0)[:, m_idx]
+        init_valid = ~np.isnan(init_values)
+        presence = df.present.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            restricted_init_means = (presence @ np.where(init_valid, init_values, 0.0)) / (presence @ init_valid)
+        return _increases_frame(rounds=df.rounds, 
+                                metrics=metrics, 
+                                vmodel_means=nan_mean(values, axis=1), 
+                                init_means=nan_mean(init_values, axis=0), 
+                                restricted_init_means=restricted_init_means)
+
+    temp_df = df[df['TaskName']=='shared_model_validation']
+    init_df = temp_df[temp_df['ModelVersion']==0]
+
+    vmodel_means = temp_df.groupby('ModelVersion', observed=True)[metrics].mean()
+
+    init_sums = init_df.groupby('CollaboratorName', observed=True)[metrics].sum(min_count=1).add_suffix('_sum')
+    init_counts = init_df.groupby('CollaboratorName', observed=True)[metrics].count().add_suffix('_count')
+    pairs = temp_df[['ModelVersion', 'CollaboratorName']].drop_duplicates()
+    merged = pairs.merge(pd.concat([init_sums, init_counts], axis=1), 
+                         left_on='CollaboratorName', 
+                         right_index=True, 
+                         how='inner')
+    per_round = merged.groupby('ModelVersion', observed=True).sum(numeric_only=True).reindex(vmodel_means.index)
+    sums = per_round[[metric + '_sum' for metric in metrics]].values
+    counts = per_round[[metric + '_count' for metric in metrics]].values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        restricted_init_means = sums / np.where(counts > 0, counts, np.nan)
+
+    return _increases_frame(rounds=vmodel_means.index.values, 
+                            metrics=metrics, 
+                            vmodel_means=vmodel_means.values, 
+                            init_means=init_df[metrics].mean().values, 
+                            restricted_init_means=restricted_init_means)
+
+
 def curvepermetric_value_over_rounds(df, 
                                      metric_names,
                                      task,
                                      xmin=0,
                                      ymin=0.0, 
-                                     ymax=1.0, 
+                                     ymax=None, 
                                      fpath=None, 
                                      custom_title=None, 
                                      no_title=False, 
                                      metric_value_column_name=None, 
                                      metric_name_column_name=None, 
-                                     model_version_column_name=None):
+                                     model_version_column_name=None, 
+                                     envelope_df=None, 
+                                     max_points=None, 
+                                     keep_rounds=None):
     """
     Lineplot metric value for a given task over rounds, a separate curve for each of a list of metrics sharing 
-    a common range (hue for each). 
+    a common range (hue for each). ymax defaults to 1 for scores and to the largest value for distances
+    (HD95, ASSD).
+    If envelope_df (see envelope_from_moments) is provided, its precomputed means and confidence bounds are
+    drawn instead of letting seaborn aggregate and bootstrap df, which then only sets the round range.
+    With max_points, every curve (and each envelope bound) is downsampled to about that many points with
+    LTTB, always keeping its best and worst rounds, its first and last rounds and keep_rounds.
     ASSUMPTIONS:
     -All metrics (in metric_names) are columns of df
+    df can also be a MetricCube.
     """
 
-    temp_df = df[df['TaskName']==task].copy()
+    if isinstance(df, MetricCube):
+        df = df.to_frame()
+
+    temp_df = df[df['TaskName']==task]
     max_rounds = temp_df['ModelVersion'].max()
     
     if metric_value_column_name is not None:
@@ -146,34 +279,43 @@ def curvepermetric_value_over_rounds(df,
     if model_version_column_name is None:
         model_version_column_name = 'ModelVersion' 
 
-    # sanity check assumptions listed above
-    if not set(metric_names).issubset(set(list(temp_df.columns))):
-        raise ValueError('Some of the provided metric names are not columns of the provided dataferame.')
-    
-    # restrict to only metric names columns, with model version as the index
-    temp_df = temp_df[['ModelVersion'] + metric_names].set_index(['ModelVersion'])
-
-    # create two level of columns to put all columns (metrics) under a top level : 'MetricValue'
-    temp_df.columns = pd.MultiIndex.from_tuples([(new_value_column_name, metric_name) for metric_name in metric_names])
-
-    # now stack the dataframe
-    final_df = temp_df.stack()
-    # Move the model version back out of the index
-    final_df = final_df.reset_index()
-
-    # At this point, final_df should have exactly three columns 'ModelVersion', 'level_1', and 'MetricValue'.
-    # The level_1 column will contain the string of which metric applies, and the MetricValue holds the value.
-
-    # renaming the level_1 column
-    final_df = final_df.rename(mapper={'level_1': new_name_column_name}, axis=1)
-    
-    final_df = final_df.rename({'ModelVersion': model_version_column_name}, axis=1)
-
-    # now ready to plot
-    g = sns.lineplot(x=model_version_column_name,
-                     y=new_value_column_name,
-                     hue=new_name_column_name,
-                     data=final_df)
+    if envelope_df is not None:
+        g = _plot_envelopes(envelope_df[envelope_df['TaskName']==task], 
+                            metric_names=metric_names, 
+                            model_version_column_name=model_version_column_name, 
+                            metric_value_column_name=new_value_column_name, 
+                            metric_name_column_name=new_name_column_name, 
+                            max_points=max_points, 
+                            keep_rounds=keep_rounds)
+    else:
+        # sanity check assumptions listed above
+        if not set(metric_names).issubset(set(list(temp_df.columns))):
+            raise ValueError('Some of the provided metric names are not columns of the provided dataferame.')
+        
+        # one row per (row, metric), with the metric name in new_name_column_name and the value in new_value_column_name
+        final_df = spread_columns_to_rows(temp_df, 
+                                          id_column='ModelVersion', 
+                                          value_columns=metric_names, 
+                                          value_name=new_value_column_name, 
+                                          name_column=new_name_column_name)
+        
+        final_df = final_df.rename({'ModelVersion': model_version_column_name}, axis=1)
+
+        if max_points is not None:
+            final_df = downsample_rounds(final_df, 
+                                         round_column=model_version_column_name, 
+                                         value_column=new_value_column_name, 
+                                         name_column=new_name_column_name, 
+                                         max_points=max_points, 
+                                         keep_rounds=keep_rounds)
+
+        # now ready to plot
+        g = sns.lineplot(x=model_version_column_name,
+                         y=new_value_column_name,
+                         hue=new_name_column_name,
+                         data=final_df)
+    if ymax is None:
+        ymax = _default_ymax(metric_names)
     g.set(xlim=(xmin,max_rounds), ylim=(ymin, ymax))
     if custom_title is None:
         title = "{} Value over Rounds for each ".format(task) + new_name_column_name
@@ -191,6 +333,103 @@ def curvepermetric_value_over_rounds(df,
 
 
 
+def _plot_envelopes(envelope_df, metric_names, model_version_column_name, metric_value_column_name, metric_name_column_name, max_points=None, keep_rounds=None):
+    # one mean line and confidence band per metric, colored and labeled as sns.lineplot would with hue
+    ax = plt.gca()
+    for metric, color in zip(metric_names, sns.color_palette(n_colors=len(metric_names))):
+        metric_df = envelope_df[envelope_df['Metric']==metric]
+        rounds = metric_df['ModelVersion'].values
+        curves = {}
+        for column in ['mean', 'low', 'high']:
+            values = metric_df[column].values
+            if max_points is None:
+                kept = np.arange(len(values))
+            else:
+                keep = None if keep_rounds is None else np.flatnonzero(np.isin(rounds, keep_rounds))
+                kept = downsample_curve(rounds, values, max_points, keep=keep)
+            curves[column] = (rounds[kept], values[kept])
+        ax.plot(*curves['mean'], color=color, label=metric)
+        if max_points is None:
+            ax.fill_between(metric_df['ModelVersion'], metric_df['low'], metric_df['high'], color=color, alpha=0.2, linewidth=0)
+        else:
+            # the bounds keep different rounds, so the band is the polygon along low and back along high
+            ax.fill(np.concatenate([curves['low'][0], curves['high'][0][::-1]]), 
+                    np.concatenate([curves['low'][1], curves['high'][1][::-1]]), 
+                    color=color, alpha=0.2, linewidth=0)
+    ax.set(xlabel=model_version_column_name, ylabel=metric_value_column_name)
+    ax.legend(title=metric_name_column_name)
+    return ax
+
+
+def round_moments(chunks, metric_names, keys=ROUND_GROUP_KEYS, filters=None):
+    """
+    Running per (round, task) count, sum and sum of squares of each metric, accumulated over an
+    iterable of frames (e.g. iter_csv_chunks) so the full validation log never has to be in memory.
+    filters optionally maps column names to the value that rows must have (as in 
+    df[df['CollaboratorName']=='institution_11']).
+    Returns a frame indexed by keys with two column levels: ('count'|'sum'|'sumsq', metric).
+    """
+    moments = None
+    for chunk in chunks:
+        if filters is not None:
+            mask = np.ones(len(chunk), dtype=bool)
+            for column, value in filters.items():
+                mask &= (chunk[column] == value).values
+            chunk = chunk[mask]
+        values = chunk[metric_names].astype(np.float64)
+        grouper = [chunk[key] for key in keys]
+        part = pd.concat({'count': values.groupby(grouper, observed=True).count(), 
+                          'sum': values.groupby(grouper, observed=True).sum(), 
+                          'sumsq': (values**2).groupby(grouper, observed=True).sum()}, axis=1)
+        if moments is None:
+            moments = part
+        else:
+            moments = moments.add(part, fill_value=0)
+    if moments is None:
+        raise ValueError('No data was provided to aggregate.')
+    return moments.sort_index()
+
+
+def mean_from_moments(moments):
+    """
+    Per group means from the output of round_moments, in the same layout as
+    df.groupby(keys)[metric_names].mean().reset_index().
+    """
+    mean_df = moments['sum'] / moments['count'].where(moments['count'] > 0)
+    mean_df.columns.name = None
+    return mean_df.reset_index()
+
+
+def envelope_from_moments(moments, confidence=0.95):
+    """
+    Per group mean and t-distribution confidence interval of every metric from the output of round_moments,
+    for all groups at once, as a long frame of the group keys, Metric, mean, low and high.
+    Groups with fewer than two values have NaN bounds.
+    """
+    count = moments['count'].where(moments['count'] > 0)
+    mean = moments['sum'] / count
+    variance = ((moments['sumsq'] - moments['sum'] * mean) / (count - 1).where(count > 1)).clip(lower=0)
+    half_width = scipy.stats.t.ppf(0.5 + confidence / 2, count - 1) * np.sqrt(variance / count)
+    envelope = pd.concat({'mean': mean.stack(dropna=False), 
+                          'low': (mean - half_width).stack(dropna=False), 
+                          'high': (mean + half_width).stack(dropna=False)}, axis=1)
+    envelope.index = envelope.index.set_names('Metric', level=-1)
+    return envelope.reset_index()
+
+
+def streamed_mean_over_rounds(fpath, metric_names, keys=ROUND_GROUP_KEYS, filters=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Bounded memory equivalent of pd.read_csv(fpath).groupby(keys)[metric_names].mean().reset_index().
+    The csv (or its cached columnar copy, see data_loading.py) is read chunksize rows at a time,
+    and only the columns needed are read.
+    """
+    columns = list(keys) + list(metric_names)
+    if filters is not None:
+        columns += [column for column in filters if column not in columns]
+    chunks = iter_csv_chunks(fpath, columns=columns, chunksize=chunksize)
+    return mean_from_moments(round_moments(chunks, metric_names=metric_names, keys=keys, filters=filters))
+
+
 def aggregated_fine_grained_binary_dice_over_rounds(df, 
                                                     task, 
                                                     show_envelope=False, 
@@ -200,10 +439,23 @@ def aggregated_fine_grained_binary_dice_over_rounds(df,
                                                     metric_name_column_name=None, 
                                                     metric_value_column_name=None, 
                                                     model_version_column_name=None, 
-                                                    metric_names=['binary_DICE_ET', 'binary_DICE_TC', 'binary_DICE_WT']): 
+                                                    metric_names=['binary_DICE_ET', 'binary_DICE_TC', 'binary_DICE_WT'], 
+                                                    chunksize=DEFAULT_CHUNKSIZE, 
+                                                    analytic_envelope=False, 
+                                                    confidence=0.95, 
+                                                    max_points=None, 
+                                                    keep_rounds=None, 
+                                                    ymin=0.0, 
+                                                    ymax=None): 
     """
     Three plots (possibly with envelopes) (one for each region et, tc, wt) for a given task of binary dice 
     scores over rounds.
+    df can also be a MetricCube, or the path of a validation csv too large to load, in which case the
+    per round means are computed in chunks of chunksize rows (see streamed_mean_over_rounds).
+    With analytic_envelope, envelopes are t confidence intervals (at confidence) of all rounds computed in one
+    pass from round_moments, instead of seaborn's per round bootstrap (and paths can then have envelopes too).
+    max_points and keep_rounds downsample the curves, and ymin and ymax set their range
+    (see curvepermetric_value_over_rounds).
     """
     
     if metric_name_column_name is not None:
@@ -212,6 +464,36 @@ def aggregated_fine_grained_binary_dice_over_rounds(df,
     if model_version_column_name is None:
         model_version_column_name = 'ModelVersion'
 
+    if show_envelope and analytic_envelope:
+        if isinstance(df, str):
+            chunks = iter_csv_chunks(df, columns=ROUND_GROUP_KEYS + list(metric_names), chunksize=chunksize)
+        else:
+            chunks = [df.to_frame() if isinstance(df, MetricCube) else df]
+        envelope_df = envelope_from_moments(round_moments(chunks, metric_names=metric_names), confidence=confidence)
+        curvepermetric_value_over_rounds(df=envelope_df, 
+                                         metric_names=metric_names,
+                                         task=task,
+                                         fpath=fpath, 
+                                         no_title=no_title, 
+                                         metric_name_column_name=metric_name_column_name, 
+                                         metric_value_column_name=metric_value_column_name, 
+                                         custom_title=custom_title, 
+                                         model_version_column_name=model_version_column_name, 
+                                         envelope_df=envelope_df, 
+                                         max_points=max_points, 
+                                         keep_rounds=keep_rounds, 
+                                         ymin=ymin, 
+                                         ymax=ymax)
+        return
+
+    if isinstance(df, str):
+        if show_envelope:
+            raise ValueError('Envelopes need the per collaborator values, provide a DataFrame instead of a path.')
+        df = streamed_mean_over_rounds(df, metric_names=metric_names, chunksize=chunksize)
+
+    if isinstance(df, MetricCube) and not show_envelope:
+        df = df.round_means_frame()
+
     if show_envelope:
         curvepermetric_value_over_rounds(df=df, 
                                          metric_names=metric_names,
@@ -221,9 +503,13 @@ def aggregated_fine_grained_binary_dice_over_rounds(df,
                                          metric_name_column_name=metric_name_column_name, 
                                          metric_value_column_name=metric_value_column_name, 
                                          custom_title=custom_title, 
-                                         model_version_column_name=model_version_column_name)
+                                         model_version_column_name=model_version_column_name, 
+                                         max_points=max_points, 
+                                         keep_rounds=keep_rounds, 
+                                         ymin=ymin, 
+                                         ymax=ymax)
     else:
-        temp_df = df.groupby(['ModelVersion', 'TaskName'])[metric_names].mean().reset_index()
+        temp_df = df.groupby(['ModelVersion', 'TaskName'], observed=True)[metric_names].mean().reset_index()
         curvepermetric_value_over_rounds(df=temp_df, 
                                          metric_names=metric_names,
                                          task=task,
@@ -232,4 +518,8 @@ def aggregated_fine_grained_binary_dice_over_rounds(df,
                                          metric_name_column_name=metric_name_column_name, 
                                          metric_value_column_name=metric_value_column_name, 
                                          custom_title=custom_title, 
-                                         model_version_column_name=model_version_column_name)
+                                         model_version_column_name=model_version_column_name, 
+                                         max_points=max_points, 
+                                         keep_rounds=keep_rounds, 
+                                         ymin=ymin, 
+                                         ymax=ymax)
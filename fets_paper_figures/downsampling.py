@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pandas as pd
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices of the n_out points Largest-Triangle-Three-Buckets keeps of the curve (x, y) (x increasing).
+
+    The first and last points are kept and every bucket in between contributes the point making the largest
+    triangle with the point kept in the previous bucket and the mean of the next bucket.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # bucket i covers [edges[i], edges[i + 1]) of the points between the first and the last
+    # (in integers, so that float rounding never moves a bucket edge)
+    edges = np.arange(n_out - 1, dtype=np.int64) * (n - 2) // (n_out - 2) + 1
+    sizes = np.diff(edges)
+    x_means = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+    y_means = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+    # the last bucket's next "mean" is the last point
+    x_next = np.append(x_means[1:], x[-1])
+    y_next = np.append(y_means[1:], y[-1])
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        areas = np.abs((x[a] - x_next[i]) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (y_next[i] - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+
+def downsample_curve(x, y, max_points, keep=None):
+    """
+    Sorted indices of at most max_points points of the curve (x, y) (plus keep, if larger) that keep its
+    shape: LTTB over the points, always keeping the first and last points, the minimum and maximum of y
+    and the indices in keep (e.g. a best round) exactly. NaN points are dropped.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) == 0:
+        return valid
+    forced = {valid[0], valid[-1], valid[np.argmin(y[valid])], valid[np.argmax(y[valid])]}
+    if keep is not None:
+        forced.update(int(index) for index in keep if not np.isnan(y[index]))
+    if len(valid) <= max_points:
+        return valid
+    chosen = valid[lttb_indices(np.asarray(x, dtype=np.float64)[valid], y[valid], max(max_points - len(forced), 3))]
+    return np.union1d(chosen, np.array(sorted(forced), dtype=np.int64))
+
+
+def downsample_rounds(df, round_column, value_column, name_column, max_points, keep_rounds=None):
+    """
+    Rows of a long (round, metric name, value) frame at the rounds downsample_curve keeps of every metric's
+    mean over rounds, so line plots aggregating df (and their error bands) have at most about max_points
+    vertices per metric. The best (highest mean) round, the lowest one, the first and last rounds and
+    keep_rounds are always kept.
+    """
+    keep_mask = np.zeros(len(df), dtype=bool)
+    rounds = df[round_column].values
+    values = df[value_column].values
+    for positions in df.groupby(name_column, sort=False).indices.values():
+        means = pd.Series(values[positions]).groupby(rounds[positions]).mean()
+        keep = None
+        if keep_rounds is not None:
+            keep = np.flatnonzero(np.isin(means.index.values, keep_rounds))
+        kept_rounds = means.index.values[downsample_curve(means.index.values, means.values, max_points, keep=keep)]
+        keep_mask[positions[np.isin(rounds[positions], kept_rounds)]] = True
+    return df[keep_mask]
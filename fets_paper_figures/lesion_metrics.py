@@ -0,0 +1,146 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage, sparse
+
+from .nifti import read_nifti, read_nifti_header
+from .plotting import BINARY_DICE, IN_DF_DICE
+from .scoring import REGIONS, REGION_MEMBERSHIP, label_indices, find_case_segmentations
+from .surface_distance import bounding_box
+
+
+# 26-connectivity: lesions touching by a corner are one lesion
+LESION_STRUCTURE = ndimage.generate_binary_structure(3, 3)
+# lesions smaller than this many voxels are dropped before scoring, as in the BraTS 2023 lesion-wise evaluation
+MIN_LESION_VOXELS = 50
+
+
+def _label_lesions(mask, structure, min_lesion_volume):
+    # connected components of mask numbered 1.. in label order, without those under min_lesion_volume voxels
+    lesions, n_lesions = ndimage.label(mask, structure=structure)
+    sizes = np.bincount(lesions.ravel(order='K'), minlength=n_lesions + 1)
+    sizes[0] = 0
+    kept = sizes >= max(min_lesion_volume, 1)
+    if kept.sum() < n_lesions:
+        new_ids = np.zeros(n_lesions + 1, dtype=lesions.dtype)
+        new_ids[kept] = np.arange(1, kept.sum() + 1)
+        lesions = new_ids[lesions]
+    return lesions, sizes[kept]
+
+
+def lesion_overlaps(gt_mask, pred_mask, structure=LESION_STRUCTURE, min_lesion_volume=MIN_LESION_VOXELS):
+    """
+    Connected components of both masks, labeled once each, and their overlaps. Components of fewer than
+    min_lesion_volume voxels are not lesions and are left out of both masks.
+
+    Returns (gt lesion sizes, pred lesion sizes, overlaps), with overlaps a sparse [gt lesion, pred lesion]
+    matrix of shared voxel counts. It is built from one bincount over the codes of the (gt lesion,
+    pred lesion) pairs found in overlapping voxels, so there is no loop over lesions.
+    """
+    gt_lesions, gt_sizes = _label_lesions(gt_mask, structure, min_lesion_volume)
+    pred_lesions, pred_sizes = _label_lesions(pred_mask, structure, min_lesion_volume)
+    n_gt, n_pred = len(gt_sizes), len(pred_sizes)
+
+    both = (gt_lesions > 0) & (pred_lesions > 0)
+    codes = (gt_lesions[both].astype(np.int64) - 1) * max(n_pred, 1) + (pred_lesions[both] - 1)
+    pairs, inverse = np.unique(codes, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(pairs))
+    overlaps = sparse.csr_matrix((counts, (pairs // max(n_pred, 1), pairs % max(n_pred, 1))), shape=(n_gt, n_pred))
+    return gt_sizes, pred_sizes, overlaps
+
+
+def lesion_scores(gt_mask, pred_mask, structure=LESION_STRUCTURE, min_lesion_volume=MIN_LESION_VOXELS):
+    """
+    Lesion-wise scores of one region, after the BraTS lesion-wise evaluation.
+
+    Lesions are the connected components (26-connected by default) of at least min_lesion_volume voxels of
+    each mask, smaller ones being dropped from both masks (BraTS uses 50). Every ground truth lesion is
+    compared with the union of the predicted lesions overlapping it. It is detected if there is at least one,
+    and its DICE is that of the lesion and this union. Predicted lesions overlapping no ground truth lesion are false positives and
+    count as a DICE of 0. Unlike BraTS, ground truth lesions are not dilated before matching. Returns
+    (per lesion frame of LesionID, Volume, Detected and DICE, summary dict of lesion-wise DICE, TP, FN and FP).
+    """
+    gt_sizes, pred_sizes, overlaps = lesion_overlaps(gt_mask, pred_mask, structure=structure, min_lesion_volume=min_lesion_volume)
+
+    matched = overlaps > 0
+    # voxels of each gt lesion covered by its matched predictions, and the size of those predictions
+    covered = np.asarray(overlaps.sum(axis=1)).ravel()
+    matched_pred_sizes = matched.astype(np.int64) @ pred_sizes
+    detected = covered > 0
+    dice = np.where(detected, 2 * covered / np.maximum(gt_sizes + matched_pred_sizes, 1), 0.0)
+
+    false_positives = int(np.sum(np.asarray(matched.sum(axis=0)).ravel() == 0))
+    n_scored = len(gt_sizes) + false_positives
+    summary = {'LesionwiseDICE': dice.sum() / n_scored if n_scored else 1.0,
+               'TP': int(detected.sum()),
+               'FN': int((~detected).sum()),
+               'FP': false_positives}
+    lesions = pd.DataFrame({'LesionID': np.arange(1, len(gt_sizes) + 1),
+                            'Volume': gt_sizes,
+                            'Detected': detected,
+                            IN_DF_DICE: dice})
+    return lesions, summary
+
+
+def lesion_wise_frames(gt, pred, voxel_volume=1.0, structure=LESION_STRUCTURE, min_lesion_volume=MIN_LESION_VOXELS):
+    """
+    Lesion-wise scores (see lesion_scores) of every region of two label maps, in long format.
+
+    Returns (lesions, summary). lesions has one row per ground truth lesion (Tumor Sub-Compartment,
+    LesionID, Volume in units of voxel_volume, Detected and DICE). summary has one row per
+    Tumor Sub-Compartment ('Average', 'WT', 'TC', 'ET'), with the lesion-wise DICE in the DICE column
+    (the layout spread_metrics_across_rows produces) and the TP, FN and FP lesion counts.
+    """
+    gt_indices, pred_indices = label_indices(gt), label_indices(pred)
+    box = bounding_box((gt_indices > 0) | (pred_indices > 0))
+    if box is not None:
+        gt_indices, pred_indices = gt_indices[box], pred_indices[box]
+
+    lesion_frames, summaries = [], []
+    for region, membership in zip(REGIONS, REGION_MEMBERSHIP):
+        lesions, summary = lesion_scores(membership[gt_indices], membership[pred_indices], structure=structure, min_lesion_volume=min_lesion_volume)
+        lesions.insert(0, BINARY_DICE, region)
+        lesions['Volume'] = lesions['Volume'] * voxel_volume
+        lesion_frames.append(lesions)
+        summaries.append({BINARY_DICE: region,
+                          IN_DF_DICE: summary['LesionwiseDICE'],
+                          'TP': summary['TP'],
+                          'FN': summary['FN'],
+                          'FP': summary['FP']})
+
+    summary = pd.DataFrame(summaries)
+    average = {BINARY_DICE: 'Average', IN_DF_DICE: summary[IN_DF_DICE].mean()}
+    average.update(summary[['TP', 'FN', 'FP']].sum().to_dict())
+    summary = pd.concat([pd.DataFrame([average]), summary], ignore_index=True)
+    return pd.concat(lesion_frames, ignore_index=True), summary
+
+
+def lesion_wise_case_dir(case_dir, structure=LESION_STRUCTURE, min_lesion_volume=MIN_LESION_VOXELS):
+    """
+    lesion_wise_frames of every model segmentation of a case folder (see find_case_segmentations),
+    with SubjectID and Model columns in front and lesion volumes in mm^3. min_lesion_volume is in voxels.
+    """
+    subject, gt_fpath, pred_fpaths = find_case_segmentations(case_dir)
+    gt = read_nifti(gt_fpath)
+    voxel_volume = read_nifti_header(gt_fpath).voxel_volume
+
+    lesion_frames, summaries = [], []
+    for model, fpath in pred_fpaths.items():
+        lesions, summary = lesion_wise_frames(gt, read_nifti(fpath), voxel_volume=voxel_volume, structure=structure, min_lesion_volume=min_lesion_volume)
+        for frame, frames in [(lesions, lesion_frames), (summary, summaries)]:
+            frame.insert(0, 'Model', model)
+            frame.insert(0, 'SubjectID', subject)
+            frames.append(frame)
+    return pd.concat(lesion_frames, ignore_index=True), pd.concat(summaries, ignore_index=True)
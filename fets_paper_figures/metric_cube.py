@@ -0,0 +1,204 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pandas as pd
+
+
+LABEL_COLUMNS = ['TaskName', 'CollaboratorName', 'ModelVersion']
+
+_AXES = {'round': 0, 'collaborator': 1, 'metric': 2}
+
+
+def _axis_number(axis):
+    if isinstance(axis, str):
+        try:
+            return _AXES[axis]
+        except KeyError:
+            raise ValueError(f'axis must be one of {list(_AXES)} or 0, 1, 2, got {axis}.')
+    return axis
+
+
+def nan_mean(values, axis):
+    """
+    Mean ignoring NaN (as pandas does), without numpy's warning for all NaN slices.
+    """
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=axis)
+    sums = np.where(valid, values, 0.0).sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / np.where(counts > 0, counts, np.nan)
+
+
+class MetricCube(object):
+    """
+    Validation scores of one task as a dense [round, collaborator, metric] array.
+
+    Labels are kept in sorted arrays with dict lookups from label to position, so selecting one round,
+    one collaborator or one metric (region) is a constant time view into the array. Entries without a
+    row in the source frame are NaN, and present records which (round, collaborator) pairs had a row,
+    since a row can exist with NaN metrics.
+    """
+
+    def __init__(self, values, rounds, collaborators, metrics, present=None, task=None):
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (len(rounds), len(collaborators), len(metrics)):
+            raise ValueError(f'values of shape {values.shape} do not match {len(rounds)} rounds, '
+                             f'{len(collaborators)} collaborators and {len(metrics)} metrics.')
+        self.values = values
+        self.rounds = np.asarray(rounds)
+        self.collaborators = np.asarray(collaborators, dtype=object)
+        self.metrics = list(metrics)
+        if present is None:
+            present = ~np.all(np.isnan(values), axis=2)
+        self.present = np.asarray(present, dtype=bool)
+        self.task = task
+
+        self.round_index = {r: i for i, r in enumerate(self.rounds.tolist())}
+        self.collaborator_index = {c: i for i, c in enumerate(self.collaborators.tolist())}
+        self.metric_index = {m: i for i, m in enumerate(self.metrics)}
+
+    @classmethod
+    def from_frame(cls, df, metrics=None, task='shared_model_validation'):
+        """
+        Build the cube from a long validation frame (one row per task, round and collaborator), for
+        the rows of the given task (all rows if task is None). metrics defaults to every numeric
+        column other than ModelVersion.
+        """
+        if task is not None:
+            df = df[df['TaskName'] == task]
+        if metrics is None:
+            metrics = [col for col in df.columns
+                       if col not in LABEL_COLUMNS and df[col].dtype.kind in 'biuf']
+        missing = [metric for metric in metrics if metric not in df.columns]
+        if missing:
+            raise ValueError(f'Some of the provided metric names {missing} are not in the provided dataframe columns {df.columns}.')
+
+        round_codes, rounds = pd.factorize(df['ModelVersion'], sort=True)
+        collaborator_codes, collaborators = pd.factorize(df['CollaboratorName'], sort=True)
+        n_rounds, n_collaborators = len(rounds), len(collaborators)
+
+        flat = round_codes.astype(np.int64) * n_collaborators + collaborator_codes
+        if len(np.unique(flat)) != len(flat):
+            raise ValueError('The frame has more than one row for some (task, round, collaborator), a cube needs at most one.')
+
+        values = np.full((n_rounds * n_collaborators, len(metrics)), np.nan)
+        values[flat] = df[metrics].to_numpy(dtype=np.float64)
+        present = np.zeros(n_rounds * n_collaborators, dtype=bool)
+        present[flat] = True
+
+        return cls(values=values.reshape(n_rounds, n_collaborators, len(metrics)),
+                   rounds=np.asarray(rounds),
+                   collaborators=np.asarray(collaborators, dtype=object),
+                   metrics=metrics,
+                   present=present.reshape(n_rounds, n_collaborators),
+                   task=task)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def position(self, kind, label):
+        """
+        Array position of a 'round', 'collaborator' or 'metric' label.
+        """
+        index = {'round': self.round_index,
+                 'collaborator': self.collaborator_index,
+                 'metric': self.metric_index}[kind]
+        try:
+            return index[label]
+        except KeyError:
+            raise ValueError(f'{label} is not a {kind} of this cube.')
+
+    def round(self, model_round):
+        """
+        [collaborator, metric] view of one round.
+        """
+        return self.values[self.position('round', model_round)]
+
+    def collaborator(self, name):
+        """
+        [round, metric] view of one collaborator.
+        """
+        return self.values[:, self.position('collaborator', name)]
+
+    def metric(self, name):
+        """
+        [round, collaborator] view of one metric (region).
+        """
+        return self.values[:, :, self.position('metric', name)]
+
+    def present_in_round(self, model_round):
+        """
+        Boolean mask over collaborators that have a row in the given round.
+        """
+        return self.present[self.position('round', model_round)]
+
+    def collaborators_in_round(self, model_round):
+        return self.collaborators[self.present_in_round(model_round)]
+
+    def mean(self, axis):
+        """
+        Mean over one or more axes ('round', 'collaborator', 'metric' or their numbers), ignoring
+        missing entries.
+        """
+        if isinstance(axis, (tuple, list)):
+            axis = tuple(_axis_number(a) for a in axis)
+        else:
+            axis = _axis_number(axis)
+        return nan_mean(self.values, axis=axis)
+
+    def rename_metrics(self, mapping):
+        """
+        Cube sharing this cube's arrays, with metrics renamed through mapping (as in df.rename(mapping, axis=1)).
+        """
+        return MetricCube(values=self.values,
+                          rounds=self.rounds,
+                          collaborators=self.collaborators,
+                          metrics=[mapping.get(metric, metric) for metric in self.metrics],
+                          present=self.present,
+                          task=self.task)
+
+    def round_frame(self, model_round):
+        """
+        Rows of one round in the layout of the source frame.
+        """
+        r = self.position('round', model_round)
+        mask = self.present[r]
+        df = pd.DataFrame(self.values[r][mask], columns=self.metrics)
+        df.insert(0, 'ModelVersion', model_round)
+        df.insert(0, 'CollaboratorName', self.collaborators[mask])
+        df.insert(0, 'TaskName', self.task)
+        return df
+
+    def round_means_frame(self):
+        """
+        Per round means over collaborators, in the layout of
+        df.groupby(['ModelVersion', 'TaskName'])[metrics].mean().reset_index().
+        """
+        keep = self.present.any(axis=1)
+        df = pd.DataFrame(self.mean('collaborator')[keep], columns=self.metrics)
+        df.insert(0, 'TaskName', self.task)
+        df.insert(0, 'ModelVersion', self.rounds[keep])
+        return df
+
+    def to_frame(self):
+        """
+        Back to a long validation frame, one row per present (round, collaborator).
+        """
+        r_idx, c_idx = np.nonzero(self.present)
+        df = pd.DataFrame(self.values[r_idx, c_idx], columns=self.metrics)
+        df.insert(0, 'ModelVersion', self.rounds[r_idx])
+        df.insert(0, 'CollaboratorName', self.collaborators[c_idx])
+        df.insert(0, 'TaskName', self.task)
+        return df
@@ -0,0 +1,144 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
+
+from .nifti import iter_nifti_slabs, read_nifti_slice
+from .scoring import BRATS_LABELS, GROUND_TRUTH, find_case_segmentations, label_indices
+
+
+MODALITIES = ['flair', 't1', 't1ce', 't2']
+SLICES_SUFFIX = '_slices.npz'
+
+# BraTS label -> overlay color (necrotic core, edema, enhancing tumor), background is transparent
+LABEL_COLORS = {1: 'red', 2: 'limegreen', 4: 'yellow'}
+
+
+def slice_scores(gt_fpath, pred_fpaths, disagreement_weight=1.0):
+    """
+    Score of every axial slice: its tumor area in the ground truth plus disagreement_weight times the
+    number of voxels where a prediction differs from the ground truth (summed over predictions).
+
+    The segmentations are streamed slab by slab together and each slab is reduced over its two in-plane axes.
+    """
+    slab_iters = [iter_nifti_slabs(fpath) for fpath in [gt_fpath] + list(pred_fpaths)]
+    scores = []
+    for slabs in zip(*slab_iters):
+        gt = slabs[0][1]
+        score = np.count_nonzero(gt, axis=(0, 1)).astype(np.float64)
+        for _, pred in slabs[1:]:
+            score += disagreement_weight * np.count_nonzero(pred != gt, axis=(0, 1))
+        scores.append(score)
+    return np.concatenate(scores)
+
+
+def best_slice(gt_fpath, pred_fpaths, disagreement_weight=1.0):
+    """
+    Index of the axial slice with the highest slice_scores (the first one on ties).
+    """
+    return int(np.argmax(slice_scores(gt_fpath, pred_fpaths, disagreement_weight=disagreement_weight)))
+
+
+def _cache_is_fresh(cache_fpath, source_fpaths, disagreement_weight):
+    if not os.path.exists(cache_fpath):
+        return False
+    cache_mtime = os.path.getmtime(cache_fpath)
+    if any(os.path.getmtime(fpath) > cache_mtime for fpath in source_fpaths):
+        return False
+    with np.load(cache_fpath) as cached:
+        return float(cached['disagreement_weight']) == disagreement_weight
+
+
+def case_slices(case_dir, cache_dir=None, disagreement_weight=1.0, modalities=MODALITIES):
+    """
+    Best axial slice (see best_slice) of every modality and segmentation of a case folder laid out as the
+    QualitativeExamples ones, as a dict {'subject', 'z', <modality>: [x, y] slice, ..., 'seg_<model>': [x, y] slice}
+    (the ground truth is 'seg_GroundTruth').
+
+    The slices are kept in a <subject>_slices.npz sidecar in cache_dir (the case folder by default) and read
+    back from it as long as it is newer than the case files, so rendering again never decompresses the volumes.
+    """
+    subject, gt_fpath, pred_fpaths = find_case_segmentations(case_dir)
+    seg_fpaths = {GROUND_TRUTH: gt_fpath}
+    seg_fpaths.update(pred_fpaths)
+    modality_fpaths = {}
+    for modality in modalities:
+        fpaths = [os.path.join(case_dir, subject + '_' + modality + ext) for ext in ['.nii.gz', '.nii']]
+        fpaths = [fpath for fpath in fpaths if os.path.exists(fpath)]
+        if len(fpaths) == 0:
+            raise ValueError(f'No {modality} volume of {subject} in {case_dir}.')
+        modality_fpaths[modality] = fpaths[0]
+
+    cache_fpath = os.path.join(cache_dir or case_dir, subject + SLICES_SUFFIX)
+    source_fpaths = list(seg_fpaths.values()) + list(modality_fpaths.values())
+    if _cache_is_fresh(cache_fpath, source_fpaths, disagreement_weight):
+        with np.load(cache_fpath) as cached:
+            slices = {key: cached[key] for key in cached.files if key != 'disagreement_weight'}
+        if all(key in slices for key in list(modality_fpaths) + ['seg_' + model for model in seg_fpaths]):
+            slices['subject'] = subject
+            slices['z'] = int(slices['z'])
+            return slices
+
+    z = best_slice(gt_fpath, pred_fpaths.values(), disagreement_weight=disagreement_weight)
+    slices = {'z': z}
+    for modality, fpath in modality_fpaths.items():
+        slices[modality] = read_nifti_slice(fpath, z)
+    for model, fpath in seg_fpaths.items():
+        slices['seg_' + model] = read_nifti_slice(fpath, z)
+    np.savez_compressed(cache_fpath, disagreement_weight=disagreement_weight, **slices)
+    slices['subject'] = subject
+    return slices
+
+
+def _label_cmap(label_colors):
+    colors = [(0, 0, 0, 0)] + [label_colors.get(label, (0, 0, 0, 0)) for label in BRATS_LABELS[1:]]
+    return ListedColormap(colors)
+
+
+def render_case_montage(slices,
+                        modalities=MODALITIES,
+                        models=None,
+                        background='flair',
+                        label_colors=LABEL_COLORS,
+                        alpha=0.5,
+                        panel_size=3):
+    """
+    Figure of the modalities of a case (first row) and of the ground truth and every model's segmentation
+    (models, all cached ones by default) overlaid on the background modality (second row).
+    slices is the output of case_slices, so layouts and colors can be changed without touching the volumes.
+    """
+    if models is None:
+        models = [key[len('seg_'):] for key in slices if key.startswith('seg_') and key != 'seg_' + GROUND_TRUTH]
+    overlays = [GROUND_TRUTH] + list(models)
+    n_columns = max(len(modalities), len(overlays))
+    fig, axes = plt.subplots(2, n_columns, figsize=(panel_size * n_columns, panel_size * 2), squeeze=False)
+    cmap = _label_cmap(label_colors)
+
+    # [x, y] slices are shown transposed with y upwards, the usual axial view
+    for ax, modality in zip(axes[0], modalities):
+        ax.imshow(slices[modality].T, cmap='gray', origin='lower')
+        ax.set_title(modality)
+    for ax, model in zip(axes[1], overlays):
+        ax.imshow(slices[background].T, cmap='gray', origin='lower')
+        labels = label_indices(slices['seg_' + model])
+        ax.imshow(labels.T, cmap=cmap, vmin=0, vmax=len(BRATS_LABELS) - 1, alpha=alpha, origin='lower', interpolation='nearest')
+        ax.set_title(model)
+    for ax in axes.ravel():
+        ax.axis('off')
+    fig.suptitle(f"{slices['subject']} (axial slice {slices['z']})")
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,179 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import struct
+
+import numpy as np
+
+
+NIFTI1_HEADER_SIZE = 348
+NIFTI1_SINGLE_FILE_OFFSET = 352
+DEFAULT_SLAB_SIZE = 16
+
+# NIfTI-1 datatype codes
+NIFTI_DTYPES = {2: 'u1',
+                4: 'i2',
+                8: 'i4',
+                16: 'f4',
+                64: 'f8',
+                256: 'i1',
+                512: 'u2',
+                768: 'u4',
+                1024: 'i8',
+                1280: 'u8'}
+
+
+class NiftiHeader(object):
+    """
+    The parts of a NIfTI-1 header needed to read the voxels of a 3D volume: shape, dtype (with byte order),
+    voxel sizes, offset of the voxel data and intensity scaling.
+    """
+
+    def __init__(self, raw):
+        if len(raw) < NIFTI1_HEADER_SIZE:
+            raise ValueError(f'A NIfTI-1 header has {NIFTI1_HEADER_SIZE} bytes, got {len(raw)}.')
+        if struct.unpack('<i', raw[:4])[0] == NIFTI1_HEADER_SIZE:
+            byte_order = '<'
+        elif struct.unpack('>i', raw[:4])[0] == NIFTI1_HEADER_SIZE:
+            byte_order = '>'
+        else:
+            raise ValueError('Not a NIfTI-1 header (sizeof_hdr is not 348 in either byte order).')
+        magic = raw[344:348]
+        if magic not in (b'n+1\x00', b'ni1\x00'):
+            raise ValueError(f'Not a NIfTI-1 header (magic is {magic}).')
+
+        dim = struct.unpack(byte_order + '8h', raw[40:56])
+        datatype, bitpix = struct.unpack(byte_order + '2h', raw[70:74])
+        pixdim = struct.unpack(byte_order + '8f', raw[76:108])
+        vox_offset, scl_slope, scl_inter = struct.unpack(byte_order + '3f', raw[108:120])
+
+        if datatype not in NIFTI_DTYPES:
+            raise ValueError(f'NIfTI datatype {datatype} is not supported.')
+        n_dims = dim[0]
+        if n_dims < 1 or n_dims > 7 or any(size > 1 for size in dim[4:n_dims + 1]):
+            raise ValueError(f'Only 3D volumes are supported, got dim {dim}.')
+
+        self.byte_order = byte_order
+        self.shape = tuple(max(size, 1) for size in (list(dim[1:n_dims + 1]) + [1, 1, 1])[:3])
+        self.dtype = np.dtype(byte_order + NIFTI_DTYPES[datatype])
+        self.pixdim = tuple(abs(size) for size in pixdim[1:4])
+        self.single_file = magic == b'n+1\x00'
+        # some writers leave vox_offset at 0 for single files, the data then follows the header and extension flag
+        self.vox_offset = max(int(vox_offset), NIFTI1_SINGLE_FILE_OFFSET) if self.single_file else int(vox_offset)
+        self.scl_slope = scl_slope
+        self.scl_inter = scl_inter
+
+    @property
+    def scaled(self):
+        """
+        Whether stored values have to be scaled (scl_slope of 0 or NaN means no scaling).
+        """
+        slope_set = np.isfinite(self.scl_slope) and self.scl_slope != 0
+        return bool(slope_set and (self.scl_slope != 1 or (np.isfinite(self.scl_inter) and self.scl_inter != 0)))
+
+    @property
+    def voxel_volume(self):
+        return float(np.prod(self.pixdim))
+
+    @property
+    def slice_bytes(self):
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def scale(self, values):
+        if not self.scaled:
+            return values
+        inter = self.scl_inter if np.isfinite(self.scl_inter) else 0.0
+        return values * np.float32(self.scl_slope) + np.float32(inter)
+
+
+def _open(fpath):
+    return gzip.open(fpath, 'rb') if fpath.endswith('.gz') else open(fpath, 'rb')
+
+
+def read_nifti_header(fpath):
+    with _open(fpath) as f:
+        return NiftiHeader(f.read(NIFTI1_HEADER_SIZE))
+
+
+def iter_nifti_slabs(fpath, slab_size=DEFAULT_SLAB_SIZE):
+    """
+    Yield (z_start, slab) for consecutive z-slabs of at most slab_size slices of a 3D NIfTI-1 volume,
+    each slab an [x, y, z] array (scaled to float if the header asks for it).
+
+    Voxels are stored x fastest, so a z-slab is one contiguous run of bytes: .nii.gz files are decompressed
+    one slab at a time into a reused buffer, so memory stays at about one slab whatever the volume size.
+    Slabs of uncompressed .nii files are views into a memory map of the file. A slab is only valid until
+    the next one is read.
+    """
+    if not fpath.endswith('.gz'):
+        header = read_nifti_header(fpath)
+        volume = _memmap_voxels(fpath, header)
+        for z_start in range(0, volume.shape[2], slab_size):
+            yield z_start, header.scale(volume[:, :, z_start:z_start + slab_size])
+        return
+
+    with gzip.open(fpath, 'rb') as f:
+        header = NiftiHeader(f.read(NIFTI1_HEADER_SIZE))
+        _check_single_file(fpath, header)
+        f.read(header.vox_offset - NIFTI1_HEADER_SIZE)
+        nx, ny, nz = header.shape
+        buffer = bytearray(header.slice_bytes * min(slab_size, nz))
+        for z_start in range(0, nz, slab_size):
+            n_slices = min(slab_size, nz - z_start)
+            view = memoryview(buffer)[:header.slice_bytes * n_slices]
+            n_read = f.readinto(view)
+            if n_read != len(view):
+                raise ValueError(f'{fpath} ends before the end of its voxel data.')
+            slab = np.frombuffer(view, dtype=header.dtype).reshape((nx, ny, n_slices), order='F')
+            yield z_start, header.scale(slab)
+
+
+def _check_single_file(fpath, header):
+    if not header.single_file:
+        raise ValueError(f'{fpath} has its voxels in a separate .img file, which is not supported.')
+
+
+def _memmap_voxels(fpath, header):
+    _check_single_file(fpath, header)
+    return np.memmap(fpath, dtype=header.dtype, mode='r', offset=header.vox_offset, shape=header.shape, order='F')
+
+
+def memmap_nifti(fpath):
+    """
+    Read only memory map of the voxels of an uncompressed 3D .nii volume, in [x, y, z] order
+    (scaled to float, in memory, if the header asks for it).
+    """
+    header = read_nifti_header(fpath)
+    return header.scale(_memmap_voxels(fpath, header))
+
+
+def read_nifti(fpath, slab_size=DEFAULT_SLAB_SIZE):
+    """
+    Whole [x, y, z] volume, filled slab by slab so that no more than the volume and one slab are in memory.
+    """
+    header = read_nifti_header(fpath)
+    volume = np.empty(header.shape, dtype=np.float32 if header.scaled else header.dtype, order='F')
+    for z_start, slab in iter_nifti_slabs(fpath, slab_size=slab_size):
+        volume[:, :, z_start:z_start + slab.shape[2]] = slab
+    return volume
+
+
+def read_nifti_slice(fpath, z, slab_size=DEFAULT_SLAB_SIZE):
+    """
+    Axial [x, y] slice z of a 3D volume. Only the slabs up to the one holding z are decompressed.
+    """
+    for z_start, slab in iter_nifti_slabs(fpath, slab_size=slab_size):
+        if z < z_start + slab.shape[2]:
+            return np.array(slab[:, :, z - z_start])
+    raise ValueError(f'{fpath} has no slice {z}.')
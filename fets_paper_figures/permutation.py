@@ -0,0 +1,159 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_PERMUTATIONS = 10000
+DEFAULT_BLOCK_SIZE = 2000
+
+
+def exact_sign_flips(start, stop, n):
+    """
+    [pattern, case] matrix of +1/-1 for the sign flip patterns start..stop-1 of n cases
+    (bit k of the pattern number flips case k).
+    """
+    patterns = np.arange(start, stop, dtype=np.int64)
+    bits = (patterns[:, None] >> np.arange(n, dtype=np.int64)[None, :]) & 1
+    return 1.0 - 2.0 * bits
+
+
+def random_sign_flips(size, n, seed):
+    """
+    [size, n] matrix of independent, equally likely +1/-1.
+    """
+    rng = np.random.default_rng(seed)
+    return 1.0 - 2.0 * rng.integers(0, 2, size=(size, n), dtype=np.int8)
+
+
+def _count_extreme(diffs, observed, block):
+    """
+    Number of sign flips of a block at least as extreme as the observed sums, for every column of diffs.
+    block is ('exact', start, stop) or ('random', size, seed).
+    """
+    kind, a, b = block
+    n = diffs.shape[0]
+    signs = exact_sign_flips(a, b, n) if kind == 'exact' else random_sign_flips(a, n, b)
+    null = np.abs(signs @ diffs)
+    # relative tolerance so that permutations tied with the observed statistic are counted despite rounding
+    tolerance = 1e-12 * np.maximum(np.abs(observed), 1.0)
+    return np.sum(null >= np.abs(observed) - tolerance, axis=0)
+
+
+def _exact_blocks(n, block_size):
+    total = 2**n
+    return [('exact', start, min(start + block_size, total)) for start in range(0, total, block_size)]
+
+
+def _random_blocks(n_permutations, seed, block_size):
+    sizes = [block_size] * (n_permutations // block_size)
+    if n_permutations % block_size:
+        sizes.append(n_permutations % block_size)
+    return [('random', size, block_seed) for size, block_seed in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+
+
+def sign_flip_test(diffs, n_permutations=DEFAULT_PERMUTATIONS, seed=0, block_size=DEFAULT_BLOCK_SIZE, n_jobs=1):
+    """
+    Two sided paired permutation tests of the mean difference for every column of a [case, comparison] array
+    of paired differences, all columns evaluated together as one matrix product per block of sign flips.
+
+    Missing differences (NaN) are set to 0, which leaves every sign flipped sum of that column unchanged,
+    so columns may have different numbers of cases. For a column of n valid differences with
+    2**n <= n_permutations every sign flip of those n is enumerated and the p-value is exact (columns with
+    the same n are enumerated together). The other columns get n_permutations random sign flips, block k
+    seeded with the k-th child of np.random.SeedSequence(seed) (so results do not depend on n_jobs), and
+    p = (1 + extreme) / (1 + n_permutations). With n_jobs > 1 the blocks are spread across a process pool.
+    Returns (mean difference, p-value, number of cases) per column.
+    """
+    diffs = np.asarray(diffs, dtype=np.float64)
+    if diffs.ndim == 1:
+        diffs = diffs[:, None]
+    valid = ~np.isnan(diffs)
+    counts = valid.sum(axis=0)
+    diffs = np.where(valid, diffs, 0.0)
+    observed = diffs.sum(axis=0)
+
+    # (columns, differences of those columns, blocks of sign flips) of every group of columns tested together
+    exact = np.exp2(counts) <= n_permutations
+    groups = []
+    if exact.any():
+        # valid differences of every column moved to its first rows, so that n rows hold all of them
+        leading = np.take_along_axis(diffs, np.argsort(~valid, axis=0, kind='stable'), axis=0)
+        for n in np.unique(counts[exact & (counts > 0)]):
+            columns = np.flatnonzero(exact & (counts == n))
+            groups.append((columns, leading[:n, columns], _exact_blocks(int(n), block_size)))
+    if not exact.all():
+        columns = np.flatnonzero(~exact)
+        groups.append((columns, diffs[:, columns], _random_blocks(n_permutations, seed, block_size)))
+
+    tasks = [(columns, group_diffs, block) for columns, group_diffs, blocks in groups for block in blocks]
+    args = ([group_diffs for _, group_diffs, _ in tasks],
+            [observed[columns] for columns, _, _ in tasks],
+            [block for _, _, block in tasks])
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = list(map(_count_extreme, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_count_extreme, *args))
+    extreme = np.zeros(diffs.shape[1], dtype=np.int64)
+    for (columns, _, _), counted in zip(tasks, results):
+        extreme[columns] += counted
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pvalues = np.where(exact, extreme / np.exp2(counts), (1 + extreme) / (1 + n_permutations))
+        mean_diffs = observed / np.where(counts > 0, counts, np.nan)
+    pvalues = np.where(counts > 0, pvalues, np.nan)
+    return mean_diffs, pvalues, counts
+
+
+def pairwise_permutation_table(df,
+                               model_column,
+                               case_column,
+                               value_column,
+                               models=None,
+                               n_permutations=DEFAULT_PERMUTATIONS,
+                               seed=0,
+                               block_size=DEFAULT_BLOCK_SIZE,
+                               n_jobs=1):
+    """
+    Square model x model frame of paired sign flip permutation test p-values, for every pair of models
+    (e.g. singlet and triplet federations) scored on the same cases.
+
+    df holds per case scores in long format: one row per (model, case) with its value_column score.
+    Each pair of models is compared on the cases both have a score for. models defaults to the models
+    of df in order of appearance. The diagonal is NaN.
+    """
+    scores = df.pivot(index=case_column, columns=model_column, values=value_column)
+    if models is None:
+        models = list(pd.unique(df[model_column]))
+    missing = [model for model in models if model not in scores.columns]
+    if missing:
+        raise ValueError(f'There are no {value_column} scores for models {missing}.')
+    scores = scores[models].to_numpy(dtype=np.float64)
+
+    pairs = list(combinations(range(len(models)), 2))
+    first, second = (np.array(side, dtype=np.intp) for side in zip(*pairs)) if pairs else (np.array([], dtype=np.intp),) * 2
+    _, pvalues, _ = sign_flip_test(scores[:, first] - scores[:, second],
+                                   n_permutations=n_permutations,
+                                   seed=seed,
+                                   block_size=block_size,
+                                   n_jobs=n_jobs)
+
+    table = np.full((len(models), len(models)), np.nan)
+    table[first, second] = pvalues
+    table[second, first] = pvalues
+    return pd.DataFrame(table, index=pd.Index(models, name=model_column), columns=models)
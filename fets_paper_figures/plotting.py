@@ -13,6 +13,8 @@
 
 import pickle as pkl
 import os
+from colorsys import rgb_to_hls
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 
@@ -25,7 +27,15 @@ from matplotlib.pyplot import figure
 import matplotlib.pyplot as plt
 import matplotlib
 
-from matplotlib.patches import PathPatch
+from matplotlib.patches import PathPatch, Rectangle
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.transforms import Bbox
+from PIL import Image
+
+from .downsampling import downsample_rounds
+from .kde import scott_bandwidth, binned_gaussian_kde
+from .metric_cube import MetricCube
+from .reshaping import spread_columns_to_rows
 
 font_scale = 2.5
 scatter_plot_pointsize = 160
@@ -41,17 +51,43 @@ DICE = 'DSC'
 IN_DF_DICE = 'DICE'
 IN_DF_JACCARD = 'JACCARD'
 JACCARD = 'JSC'
+IN_DF_HD95 = 'HD95'
+HD95 = 'HD95 (mm)'
+IN_DF_ASSD = 'ASSD'
+ASSD = 'ASSD (mm)'
 
 value_label = 'Total Cases(train and val)'
 
 interp_MBD_best_round = 52
 
+# collections with more than one vertex or marker per this many pixels of their axes (at the saved dpi) are
+# rasterized in vector outputs of save_at_dpi(..., formats=...): about where the image gets smaller than the vectors
+RASTERIZE_PIXELS_PER_VERTEX = 32
+
+
+
 
+def _line_index(lines):
+    """
+    Lines of a boxplot keyed by the x they are centered on: two point lines (medians, whiskers, caps) by their
+    midpoint and lines with all points at one x (means, fliers) by that x, as {x: [(line, is_segment), ...]}.
+    """
+    index = {}
+    for l in lines:
+        l_pos = np.asarray(l.get_xdata(), dtype=float)
+        if len(l_pos) == 2:
+            index.setdefault((l_pos[0] + l_pos[1]) / 2.0, []).append((l, True))
+        elif len(l_pos) > 0 and np.all(l_pos == l_pos[0]):
+            index.setdefault(l_pos[0], []).append((l, False))
+    return index
 
 
-def adjust_boxes(ax, shrink_factor, shifts, group_size):
+def adjust_boxes(ax, shrink_factor, shifts, group_size, indexed=True):
     """
     Adjust the widths of a seaborn-generated boxplot.
+
+    With indexed, the lines of the axes are indexed by their center once, so every box only looks up its
+    own median, whiskers, caps and mean instead of scanning all lines (boxes x lines comparisons otherwise).
     """
     
     for num in range(group_size):
@@ -59,6 +95,7 @@ def adjust_boxes(ax, shrink_factor, shifts, group_size):
             raise ValueError("The shifts dictionary must contain keys for all residuals in range(group_size).")
     
     count = 0
+    line_index = _line_index(ax.lines) if indexed else None
 
     # iterating through axes artists:
     for c in ax.get_children():
@@ -80,14 +117,22 @@ def adjust_boxes(ax, shrink_factor, shifts, group_size):
             xmid = 0.5*(xmin+xmax)
             xhalf = 0.5*(xmax - xmin)
             
-            # print(f"\nGot an xmid of: {xmid}\n")
-            
             # setting new width of box
             xmin_new = xmid-shrink_factor*xhalf + shift
             xmax_new = xmid+shrink_factor*xhalf + shift
             verts_sub[verts_sub[:, 0] == xmin, 0] = xmin_new
             verts_sub[verts_sub[:, 0] == xmax, 0] = xmax_new
 
+            if indexed:
+                # lines centered on the box: the median spans it, the others move with it
+                for l, is_segment in line_index.get(xmid, []):
+                    l_pos = np.asarray(l.get_xdata(), dtype=float)
+                    if is_segment and l_pos[0] == xmin:
+                        l.set_xdata([xmin_new, xmax_new])
+                    else:
+                        l.set_xdata(l_pos + shift)
+                continue
+
             # setting new width of median line
             for l in ax.lines:
                 l_pos = l.get_xdata()
@@ -115,37 +160,129 @@ def prep_plots(font_scale=font_scale, scatter_plot_pointsize=scatter_plot_points
     plt.tight_layout()
     
     
-def my_violin_plot(x_column, 
-                   y_column, 
+def _category_levels(values, order=None):
+    # levels in order of appearance (sorted if numeric), as seaborn orders categories, from the uniques only
+    if order is not None:
+        return list(order)
+    levels = pd.unique(values)
+    levels = levels[~pd.isna(levels)]
+    if pd.api.types.is_numeric_dtype(values):
+        levels = np.sort(levels)
+    return list(levels)
+
+
+def binned_violinplot(x,
+                      y,
+                      data,
+                      hue=None,
+                      order=None,
+                      hue_order=None,
+                      palette=None,
+                      saturation=0.75,
+                      width=0.8,
+                      cut=2,
+                      gridsize=100,
+                      bw_adjust=1,
+                      ax=None,
+                      **kwargs):
+    """
+    Violins laid out, colored and normalized as sns.violinplot draws them (dodged hue levels, 'area' density
+    normalization per hue level, scott bandwidth, cut and gridsize), but with the densities of every group
+    from binned_gaussian_kde, so large groups cost about as much as small ones. Extra kwargs go to fill_betweenx.
+    """
+    if ax is None:
+        ax = plt.gca()
+    x_levels = _category_levels(data[x], order)
+    hue_levels = [None] if hue is None else _category_levels(data[hue], hue_order)
+    if isinstance(palette, dict):
+        colors = [palette[level] for level in hue_levels]
+    else:
+        colors = sns.color_palette(palette, len(hue_levels))
+    colors = [sns.desaturate(color, saturation) for color in colors]
+    # seaborn's automatic edge (and so hatch) color: a gray darker than every fill color
+    lum = min(rgb_to_hls(*matplotlib.colors.to_rgb(color))[1] for color in colors) * .6
+    kwargs.setdefault('edgecolor', (lum, lum, lum))
+
+    group_columns = [x] if hue is None else [x, hue]
+    groups = data.groupby(group_columns, sort=False)[y]
+    violins = []
+    for key, values in groups:
+        key = key if isinstance(key, tuple) else (key,)
+        x_level, hue_level = key[0], (key[1] if hue is not None else None)
+        values = values.to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if x_level not in x_levels or hue_level not in hue_levels or len(values) == 0:
+            continue
+        bandwidth = scott_bandwidth(values, bw_adjust) if len(values) > 1 else 0.0
+        if not bandwidth > 0:
+            # no spread to estimate a density from, drawn as a line at the value
+            violins.append((x_level, hue_level, values.mean(), None))
+            continue
+        support = np.linspace(values.min() - cut * bandwidth, values.max() + cut * bandwidth, gridsize)
+        violins.append((x_level, hue_level, support, binned_gaussian_kde(values, support, bandwidth)))
+
+    # 'area' normalization: the highest density of each hue level spans its whole width
+    max_density = {}
+    for _, hue_level, _, density in violins:
+        if density is not None:
+            max_density[hue_level] = max(max_density.get(hue_level, 0), density.max())
+    violin_width = width / len(hue_levels)
+    for x_level, hue_level, support, density in violins:
+        hue_index = hue_levels.index(hue_level)
+        position = x_levels.index(x_level) + violin_width * hue_index + violin_width / 2 - width / 2
+        if density is None:
+            ax.plot([position - violin_width / 2, position + violin_width / 2], [support, support], color=colors[hue_index])
+            continue
+        span = density / max_density[hue_level] * violin_width / 2
+        ax.fill_betweenx(support, position - span, position + span, facecolor=colors[hue_index], **kwargs)
+
+    ax.set_xticks(range(len(x_levels)), x_levels)
+    ax.set_xlim(-0.5, len(x_levels) - 0.5)
+    ax.set(xlabel=x, ylabel=y)
+    if hue is not None:
+        for level, color in zip(hue_levels, colors):
+            ax.add_patch(Rectangle((0, 0), 0, 0, facecolor=color, linewidth=0, label=level))
+        ax.legend(title=hue)
+    return ax
+
+
+def my_violin_plot(x_column,
+                   y_column,
                    data,
                    group_size,
                    shrink_factor,
-                   shifts, 
+                   shifts,
                    box_width,
-                   hatch=None, 
-                   mean_marker_size=mean_marker_size, 
-                   hue=None, 
-                   sorting_key= lambda x: x.apply(lambda x: x), 
+                   hatch=None,
+                   mean_marker_size=mean_marker_size,
+                   hue=None,
+                   sorting_key= lambda x: x.apply(lambda x: x),
+                   binned_kde=False,
                    **kwargs):
-    
+    """
+    Violins with shrunk and shifted boxplots on top. With binned_kde, the violin densities come from
+    binned_violinplot (binned FFT kernel density estimates) instead of sns.violinplot, for large groups.
+    """
+
     prep_plots()
-    
+
     if hue == None:
         groups = [x_column]
     else:
         groups = [x_column, hue]
         kwargs.update({'hue': hue})
-        
+
     data = data.sort_values(by=hue, key=sorting_key)
-    
-    ax = sns.violinplot(x=x_column, 
-                        y=y_column, 
-                        data=data,
-                        inner=None, 
-                        linewidth=0, 
-                        saturation=0.5,
-                        cut=0,
-                        **kwargs)
+
+    violin_plot = binned_violinplot if binned_kde else sns.violinplot
+    ax = violin_plot(x=x_column,
+                     y=y_column,
+                     data=data,
+                     linewidth=0,
+                     saturation=0.5,
+                     cut=0,
+                     **({} if binned_kde else {'inner': None}),
+                     **kwargs)
     
     handles, labels = ax.get_legend_handles_labels()
     
@@ -182,25 +319,41 @@ def my_violin_plot(x_column,
     return ax
 
 
+def _default_ymax(metric_names):
+    # scores (DICE, JACCARD) are plotted over [0, 1], distances (HD95, ASSD, in mm) up to their largest values
+    if any(distance in name for name in metric_names for distance in (IN_DF_HD95, IN_DF_ASSD)):
+        return None
+    return 1.0
+
+
 def curvepermetric_value_over_rounds(df, 
                                      metric_names,
                                      task,
                                      xmin=0,
                                      ymin=0.0, 
-                                     ymax=1.0, 
+                                     ymax=None, 
                                      fpath=None, 
                                      custom_title=None, 
                                      no_title=False, 
                                      metric_value_column_name=None, 
-                                     metric_name_column_name=None):
+                                     metric_name_column_name=None, 
+                                     max_points=None, 
+                                     keep_rounds=None):
     """
     Lineplot metric value for a given task over rounds, a separate curve for each of a list of metrics sharing 
-    a common range (hue for each). 
+    a common range (hue for each). ymax defaults to 1 for scores and to the largest value for distances
+    (HD95, ASSD).
+    With max_points, every curve is downsampled to about that many rounds (see downsample_rounds), always
+    keeping its best and worst rounds, its first and last rounds and keep_rounds.
     ASSUMPTIONS:
     -All metrics (in metric_names) are columns of df
+    df can also be a MetricCube.
     """
 
-    temp_df = df[df['TaskName']==task].copy()
+    if isinstance(df, MetricCube):
+        df = df.to_frame()
+
+    temp_df = df[df['TaskName']==task]
     max_rounds = temp_df['ModelVersion'].max()
     
     if metric_value_column_name is not None:
@@ -217,25 +370,22 @@ def curvepermetric_value_over_rounds(df,
     if not set(metric_names).issubset(set(list(temp_df.columns))):
         raise ValueError(f'Some of the provided metric names {metric_names} are not in the provided dataferame columns {temp_df.columns}.')
     
-    # restrict to only metric names columns, with model version as the index
-    temp_df = temp_df[['ModelVersion'] + metric_names].set_index(['ModelVersion'])
-
-    # create two level of columns to put all columns (metrics) under a top level : 'MetricValue'
-    temp_df.columns = pd.MultiIndex.from_tuples([(new_value_column_name, metric_name) for metric_name in metric_names])
-
-    # now stack the dataframe
-    final_df = temp_df.stack()
-    # Move the model version back out of the index
-    final_df = final_df.reset_index()
-
-    # At this point, final_df should have exactly three columns 'ModelVersion', 'level_1', and 'MetricValue'.
-    # The level_1 column will contain the string of which metric applies, and the MetricValue holds the value.
-
-    # renaming the level_1 column
-    final_df = final_df.rename(mapper={'level_1': new_name_column_name}, axis=1)
+    # one row per (row, metric), with the metric name in new_name_column_name and the value in new_value_column_name
+    final_df = spread_columns_to_rows(temp_df, 
+                                      id_column='ModelVersion', 
+                                      value_columns=metric_names, 
+                                      value_name=new_value_column_name, 
+                                      name_column=new_name_column_name)
     
     final_df = final_df.rename({'ModelVersion': 'FL Training Round'}, axis=1)
     
+    if max_points is not None:
+        final_df = downsample_rounds(final_df, 
+                                     round_column='FL Training Round', 
+                                     value_column=new_value_column_name, 
+                                     name_column=new_name_column_name, 
+                                     max_points=max_points, 
+                                     keep_rounds=keep_rounds)
     
     # now ready to plot
     g = sns.lineplot(x='FL Training Round',
@@ -254,12 +404,126 @@ def curvepermetric_value_over_rounds(df,
     save_at_dpi(fpath)
 
 
-    
+def curvepermetric_value_over_volume(binned_df,
+                                     metric_names,
+                                     volume_column_name,
+                                     metric_value_column_name,
+                                     metric_name_column_name=BINARY_DICE,
+                                     ymin=0.0,
+                                     ymax=1.0,
+                                     fpath=None,
+                                     custom_title=None,
+                                     no_title=False):
+    """
+    Lineplot of a metric value over (log scale) region volume, a separate curve for each of a list of regions
+    with a band of one standard error, from the binned frame of binned_value_over_volume.
+    """
+    ax = plt.gca()
+    for region, color in zip(metric_names, sns.color_palette(n_colors=len(metric_names))):
+        region_df = binned_df[binned_df[metric_name_column_name]==region]
+        ax.plot(region_df[volume_column_name], region_df[metric_value_column_name], marker='o', color=color, label=region)
+        ax.fill_between(region_df[volume_column_name],
+                        region_df[metric_value_column_name] - region_df['sem'],
+                        region_df[metric_value_column_name] + region_df['sem'],
+                        color=color,
+                        alpha=0.2)
+    ax.set(xscale='log', ylim=(ymin, ymax), xlabel=volume_column_name, ylabel=metric_value_column_name)
+    ax.legend(title=metric_name_column_name)
+    if custom_title is None:
+        title = "{} over Region Volume".format(metric_value_column_name)
+    else:
+        title = custom_title
 
+    if not no_title:
+        plt.title(title)
+    print("Saving output file at: ", fpath)
+    save_at_dpi(fpath)
+
+
+
+
+
+
+def _vertex_count(collection):
+    # vertices (or markers) a vector backend would write for a collection
+    n_vertices = sum(len(path.vertices) for path in collection.get_paths())
+    return max(n_vertices, len(collection.get_offsets()))
 
 
-def save_at_dpi(fpath, dpi=600, **kwargs):
-    plt.savefig(fpath, dpi=dpi, bbox_inches='tight', **kwargs)
+def _dense_collections(fig, pixels_per_vertex):
+    # lines are left out: their paths are simplified when saved, so they stay small as vectors
+    dense = []
+    for collection in fig.findobj(matplotlib.collections.Collection):
+        area = (collection.axes or fig).bbox
+        if not collection.get_rasterized() and _vertex_count(collection) * pixels_per_vertex > area.width * area.height:
+            dense.append(collection)
+    return dense
+
+
+def _write_png(fpath, pixels, dpi):
+    Image.fromarray(pixels).save(fpath, format='png', dpi=(dpi, dpi))
+
+
+def save_at_dpi(fpath, dpi=600, formats=None, rasterize_pixels_per_vertex=RASTERIZE_PIXELS_PER_VERTEX, n_threads=2, **kwargs):
+    """
+    Save the current figure at dpi with a tight bounding box.
+
+    With formats (e.g. ['pdf', 'png', 'svg']), the figure is saved once per format next to fpath (its extension
+    replaced) and the paths are returned. The figure is drawn once with Agg at dpi: the tight bounding box is
+    taken from that draw and reused by every format, and the png is cropped from it and compressed on a thread
+    pool while the vector formats are written. In vector formats, collections with more than one vertex or marker
+    per rasterize_pixels_per_vertex pixels of their axes at dpi (large scatters) are embedded as images at dpi.
+    """
+    if formats is None:
+        plt.savefig(fpath, dpi=dpi, bbox_inches='tight', **kwargs)
+        return [fpath]
+
+    fig = plt.gcf()
+    root = os.path.splitext(fpath)[0]
+    fpaths = [root + '.' + fmt for fmt in formats]
+    pad_inches = kwargs.pop('pad_inches', matplotlib.rcParams['savefig.pad_inches'])
+
+    original_dpi = fig.dpi
+    fig.set_dpi(dpi)
+    try:
+        width, height = fig.get_size_inches() * dpi
+        renderer = RendererAgg(int(width), int(height), dpi)
+        fig.draw(renderer)
+        bbox = fig.get_tightbbox(renderer).padded(pad_inches)
+        # snapped outwards to whole pixels, so that the crop of the draw below matches savefig (up to the phase of hatches)
+        bbox = Bbox(np.stack([np.floor(bbox.p0 * dpi), np.ceil(bbox.p1 * dpi)]) / dpi)
+        pixels = np.asarray(renderer.buffer_rgba())
+
+        dense = []
+        if rasterize_pixels_per_vertex is not None:
+            dense = _dense_collections(fig, rasterize_pixels_per_vertex)
+    finally:
+        fig.set_dpi(original_dpi)
+
+    # the png is cut out of the draw when the tight box is inside the figure (savefig would grow the canvas otherwise)
+    n_rows, n_columns = pixels.shape[:2]
+    x0, x1 = int(round(bbox.x0 * dpi)), int(round(bbox.x1 * dpi))
+    y0, y1 = n_rows - int(round(bbox.y1 * dpi)), n_rows - int(round(bbox.y0 * dpi))
+    crop_png = not kwargs and x0 >= 0 and y0 >= 0 and x1 <= n_columns and y1 <= n_rows
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        # the png is compressed in the background while the other formats are written
+        futures = [executor.submit(_write_png, out_fpath, pixels[y0:y1, x0:x1].copy(), dpi)
+                   for fmt, out_fpath in zip(formats, fpaths) if fmt == 'png' and crop_png]
+        for fmt, out_fpath in zip(formats, fpaths):
+            if fmt == 'png' and crop_png:
+                continue
+            vector = fmt in ('pdf', 'svg', 'eps', 'ps')
+            for collection in dense if vector else []:
+                collection.set_rasterized(True)
+            try:
+                fig.savefig(out_fpath, format=fmt, dpi=dpi, bbox_inches=bbox, pad_inches=0, **kwargs)
+            finally:
+                for collection in dense if vector else []:
+                    collection.set_rasterized(False)
+        for future in futures:
+            future.result()
+    return fpaths
 
 
 
@@ -0,0 +1,61 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pandas as pd
+
+
+def spread_columns_to_rows(df, id_column, value_columns, value_name, name_column, names=None, sort_names=True):
+    """
+    Long format version of df: one row per (row of df, value column), with columns
+    [id_column, name_column, value_name], rows in the order of df and rows with a missing value dropped.
+    Within a row the value columns follow the sorted names, as DataFrame.stack orders them (this
+    decides the hue order of the plots), or the order of value_columns if sort_names is False.
+
+    This is the output of the set_index / MultiIndex columns / stack / reset_index / rename sequence
+    the plotting functions used to run, built directly from one [row, column] array: the values are
+    raveled, the ids repeated and the column labels tiled, so no intermediate copies of the frame
+    or MultiIndex are created. names optionally relabels value_columns in name_column.
+    """
+    if names is None:
+        names = value_columns
+    if len(names) != len(value_columns):
+        raise ValueError(f'Got {len(names)} names for {len(value_columns)} value columns.')
+    if sort_names:
+        names, value_columns = zip(*sorted(zip(names, value_columns)))
+        names, value_columns = list(names), list(value_columns)
+
+    n_rows, n_columns = len(df), len(value_columns)
+    values = df[value_columns].to_numpy().ravel()
+    id_values = df[id_column].values
+    name_codes = np.tile(np.arange(n_columns, dtype=np.min_scalar_type(max(n_columns - 1, 0))), n_rows)
+
+    keep = None
+    if values.dtype.kind in 'fc' or values.dtype == object:
+        keep = ~pd.isnull(values)
+        if keep.all():
+            keep = None
+
+    if keep is None:
+        ids = np.repeat(id_values, n_columns)
+    else:
+        # repeat each id by its number of kept values, rather than masking a fully repeated copy
+        ids = np.repeat(id_values, keep.reshape(n_rows, n_columns).sum(axis=1))
+        values = values[keep]
+        name_codes = name_codes[keep]
+    labels = np.asarray(names, dtype=object)[name_codes]
+
+    # concat without copy puts the three arrays in the frame as they are
+    return pd.concat([pd.Series(ids, name=id_column), 
+                      pd.Series(labels, name=name_column), 
+                      pd.Series(values, name=value_name)], axis=1, copy=False)
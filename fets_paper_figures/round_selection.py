@@ -0,0 +1,104 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pandas as pd
+
+
+BEST_ROUND_CRITERIA = ['mean', 'collaborator_weighted', 'moving_average']
+
+
+class BestRoundSelector(object):
+    """
+    Scores every ModelVersion of a validation frame and picks the best one, replacing a hand searched
+    value such as plotting.interp_MBD_best_round.
+
+    Criteria:
+    -'mean': mean of metric over all rows of the round (what the paper's best round was chosen on)
+    -'collaborator_weighted': mean over collaborators of each collaborator's mean, weighted by weights
+     (a dict from collaborator name to e.g. its number of validation cases, equal weights if None)
+    -'moving_average': the 'mean' curve smoothed by a centered moving average over window rounds
+
+    Only per (round, collaborator) sums and counts are kept, so rounds appended to the federation
+    logs can be added with update() without revisiting earlier rows.
+    """
+
+    def __init__(self,
+                 metric='MeanBinaryDICE',
+                 criterion='mean',
+                 weights=None,
+                 window=5,
+                 task='shared_model_validation'):
+        if criterion not in BEST_ROUND_CRITERIA:
+            raise ValueError(f'criterion must be one of {BEST_ROUND_CRITERIA}, got {criterion}.')
+        self.metric = metric
+        self.criterion = criterion
+        self.weights = weights
+        self.window = window
+        self.task = task
+        self.sums = None
+        self.counts = None
+
+    def update(self, df):
+        """
+        Add the rows of df (new rounds, or new collaborators of known rounds). Returns self.
+        """
+        if self.task is not None:
+            df = df[df['TaskName'] == self.task]
+        grouped = df.groupby(['ModelVersion', 'CollaboratorName'], observed=True)[self.metric]
+        sums, counts = grouped.sum(), grouped.count()
+        if self.sums is None:
+            self.sums, self.counts = sums, counts
+        else:
+            self.sums = self.sums.add(sums, fill_value=0)
+            self.counts = self.counts.add(counts, fill_value=0)
+        return self
+
+    def scores(self):
+        """
+        Series of criterion values indexed by ModelVersion.
+        """
+        if self.sums is None:
+            raise ValueError('No rows have been added, call update() first.')
+
+        if self.criterion == 'collaborator_weighted':
+            collaborator_means = (self.sums / self.counts.where(self.counts > 0)).dropna()
+            collaborators = collaborator_means.index.get_level_values('CollaboratorName')
+            if self.weights is None:
+                weights = pd.Series(1.0, index=collaborator_means.index)
+            else:
+                weights = pd.Series(collaborators.map(self.weights).astype(np.float64), index=collaborator_means.index)
+                if weights.isnull().any():
+                    raise ValueError(f'No weight was provided for collaborators {sorted(set(collaborators[weights.isnull().values]))}.')
+            weighted = (collaborator_means * weights).groupby(level='ModelVersion').sum()
+            return (weighted / weights.groupby(level='ModelVersion').sum()).sort_index()
+
+        round_sums = self.sums.groupby(level='ModelVersion').sum()
+        round_counts = self.counts.groupby(level='ModelVersion').sum()
+        means = (round_sums / round_counts.where(round_counts > 0)).sort_index()
+        if self.criterion == 'moving_average':
+            return means.rolling(window=self.window, center=True, min_periods=1).mean()
+        return means
+
+    def best_round(self):
+        scores = self.scores()
+        if scores.isnull().all():
+            raise ValueError(f'No round has a {self.metric} value to select on.')
+        return scores.idxmax()
+
+
+def select_best_round(df, **kwargs):
+    """
+    Best ModelVersion of a validation frame, kwargs are those of BestRoundSelector.
+    """
+    return BestRoundSelector(**kwargs).update(df).best_round()
@@ -0,0 +1,71 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pandas as pd
+
+
+# columns of the per round validation frames (val_df_final.csv and the like)
+CATEGORICAL_COLUMNS = ['TaskName', 'CollaboratorName']
+ROUND_COLUMN = 'ModelVersion'
+
+
+def _narrowest_int(values, candidates=(np.int16, np.int32, np.int64)):
+    if len(values) == 0:
+        return candidates[0]
+    vmin, vmax = values.min(), values.max()
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if info.min <= vmin and vmax <= info.max:
+            return dtype
+    return np.int64
+
+
+def compact_validation_frame(df, float32_metrics=False, categorical_columns=CATEGORICAL_COLUMNS):
+    """
+    Return a copy of a validation frame with the label columns stored as categoricals, the round
+    column as int16 (wider only if the rounds do not fit) and, if float32_metrics is set, every
+    float64 column (the metrics) as float32.
+
+    Columns that are not present are ignored, so any of the per round frames can be passed. The
+    package functions accept the result as-is: equality filters such as df['TaskName']==task then
+    compare small integer codes instead of strings.
+    """
+    df = df.copy()
+    for col in categorical_columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+    if ROUND_COLUMN in df.columns and df[ROUND_COLUMN].dtype.kind in 'iu':
+        df[ROUND_COLUMN] = df[ROUND_COLUMN].astype(_narrowest_int(df[ROUND_COLUMN].values))
+
+    if float32_metrics:
+        for col in df.columns:
+            if df[col].dtype == np.float64:
+                df[col] = df[col].astype(np.float32)
+
+    return df
+
+
+def memory_savings(df, compact_df):
+    """
+    Per column memory (deep, in bytes) of a frame before and after compact_validation_frame,
+    with a 'Total' row at the bottom.
+    """
+    before = df.memory_usage(deep=True, index=False)
+    after = compact_df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({'before': before, 'after': after})
+    report.loc['Total'] = report.sum()
+    report['saved'] = report['before'] - report['after']
+    report['ratio'] = report['before'] / report['after']
+    return report
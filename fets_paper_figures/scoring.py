@@ -0,0 +1,205 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from .nifti import DEFAULT_SLAB_SIZE, iter_nifti_slabs, read_nifti, read_nifti_header
+from .plotting import IN_DF_DICE, IN_DF_JACCARD
+
+
+# BraTS labels: 1 necrotic / non-enhancing core, 2 edema, 4 enhancing tumor
+BRATS_LABELS = [0, 1, 2, 4]
+REGIONS = ['WT', 'TC', 'ET']
+REGION_LABELS = {'WT': [1, 2, 4],
+                 'TC': [1, 4],
+                 'ET': [4]}
+
+SEG_SUFFIX = '_seg_'
+GROUND_TRUTH = 'GroundTruth'
+
+
+def _label_lut(labels=BRATS_LABELS):
+    lut = np.full(max(labels) + 1, -1, dtype=np.int8)
+    lut[labels] = np.arange(len(labels))
+    return lut
+
+
+LABEL_LUT = _label_lut()
+
+# [region, label index] membership, so that region counts are products with the label confusion matrix
+REGION_MEMBERSHIP = np.array([[label in REGION_LABELS[region] for label in BRATS_LABELS] for region in REGIONS])
+
+
+def load_label_map(fpath):
+    """
+    Integer label array of a segmentation volume, read in its stored dtype (no float conversion).
+    """
+    return read_nifti(fpath)
+
+
+def label_indices(label_map):
+    """
+    Position of every voxel's label in BRATS_LABELS, from one lookup table pass.
+    """
+    label_map = np.asarray(label_map)
+    if label_map.size and (label_map.min() < 0 or label_map.max() >= len(LABEL_LUT)):
+        raise ValueError(f'Label map has values outside of the expected labels {BRATS_LABELS}.')
+    indices = LABEL_LUT[label_map.astype(np.intp, copy=False)]
+    if (indices < 0).any():
+        raise ValueError(f'Label map has values {sorted(set(np.unique(label_map)) - set(BRATS_LABELS))}, expected only {BRATS_LABELS}.')
+    return indices
+
+
+def confusion_from_indices(gt_indices, pred_indices):
+    """
+    [gt label, pred label] voxel counts from label indices (see label_indices), from one bincount of the pairs.
+    """
+    if gt_indices.shape != pred_indices.shape:
+        raise ValueError(f'Ground truth of shape {gt_indices.shape} and prediction of shape {pred_indices.shape} do not match.')
+    n_labels = len(BRATS_LABELS)
+    # pair codes stay int8 (at most n_labels**2 - 1) and are raveled in memory order, since NIfTI
+    # volumes are usually Fortran ordered and a C order ravel would copy them
+    pairs = gt_indices * np.int8(n_labels) + pred_indices
+    return np.bincount(pairs.ravel(order='K'), minlength=n_labels * n_labels).reshape(n_labels, n_labels)
+
+
+def label_confusion(gt, pred):
+    """
+    [gt label, pred label] voxel counts over BRATS_LABELS.
+    """
+    return confusion_from_indices(label_indices(gt), label_indices(pred))
+
+
+def streamed_label_confusions(gt_fpath, pred_fpaths, slab_size=DEFAULT_SLAB_SIZE):
+    """
+    [prediction, gt label, pred label] voxel counts of the ground truth against every volume of pred_fpaths,
+    accumulated over z-slabs read in lockstep, so that no volume is ever fully in memory. The ground truth is
+    decompressed and mapped to label indices once, whatever the number of predictions.
+    """
+    n_labels = len(BRATS_LABELS)
+    confusions = np.zeros((len(pred_fpaths), n_labels, n_labels), dtype=np.int64)
+    if not len(pred_fpaths):
+        return confusions
+    gt_shape = read_nifti_header(gt_fpath).shape
+    for fpath in pred_fpaths:
+        shape = read_nifti_header(fpath).shape
+        if shape != gt_shape:
+            raise ValueError(f'{gt_fpath} of shape {gt_shape} and {fpath} of shape {shape} do not match.')
+
+    gt_slabs = iter_nifti_slabs(gt_fpath, slab_size=slab_size)
+    pred_slabs = [iter_nifti_slabs(fpath, slab_size=slab_size) for fpath in pred_fpaths]
+    for (_, gt_slab), *pred_slabs_at_z in zip(gt_slabs, *pred_slabs):
+        gt_indices = label_indices(gt_slab)
+        for confusion, (_, pred_slab) in zip(confusions, pred_slabs_at_z):
+            confusion += confusion_from_indices(gt_indices, label_indices(pred_slab))
+    return confusions
+
+
+def streamed_label_confusion(gt_fpath, pred_fpath, slab_size=DEFAULT_SLAB_SIZE):
+    """
+    label_confusion of two segmentation volumes, accumulated over z-slabs (see streamed_label_confusions).
+    """
+    return streamed_label_confusions(gt_fpath, [pred_fpath], slab_size=slab_size)[0]
+
+
+def label_voxel_counts(fpath, slab_size=DEFAULT_SLAB_SIZE):
+    """
+    Number of voxels of every label of BRATS_LABELS in a segmentation volume, accumulated over z-slabs.
+    """
+    counts = np.zeros(len(BRATS_LABELS), dtype=np.int64)
+    for _, slab in iter_nifti_slabs(fpath, slab_size=slab_size):
+        counts += np.bincount(label_indices(slab).ravel(order='K'), minlength=len(BRATS_LABELS))
+    return counts
+
+
+def region_counts(confusion):
+    """
+    (TP, FP, FN) arrays over REGIONS, derived from the label confusion matrix.
+    """
+    inside = REGION_MEMBERSHIP.astype(np.int64)
+    outside = 1 - inside
+    tp = np.einsum('rg,gp,rp->r', inside, confusion, inside)
+    fp = np.einsum('rg,gp,rp->r', outside, confusion, inside)
+    fn = np.einsum('rg,gp,rp->r', inside, confusion, outside)
+    return tp, fp, fn
+
+
+def scores_from_counts(tp, fp, fn, empty_score=1.0):
+    """
+    Binary DICE and JACCARD of every region and their means over regions, in the val_df column schema.
+    Regions empty in both ground truth and prediction score empty_score.
+    """
+    tp, fp, fn = (np.asarray(count, dtype=np.float64) for count in (tp, fp, fn))
+    empty = (tp + fp + fn) == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dice = np.where(empty, empty_score, 2 * tp / (2 * tp + fp + fn))
+        jaccard = np.where(empty, empty_score, tp / (tp + fp + fn))
+
+    scores = {}
+    for name, values in [(IN_DF_DICE, dice), (IN_DF_JACCARD, jaccard)]:
+        scores['MeanBinary' + name] = np.mean(values)
+        for region, value in zip(REGIONS, values):
+            scores['binary_' + name + '_' + region] = value
+    return scores
+
+
+def score_label_maps(gt, pred, empty_score=1.0):
+    """
+    DICE and JACCARD scores of a predicted label map against the ground truth (see scores_from_counts).
+    """
+    return scores_from_counts(*region_counts(label_confusion(gt, pred)), empty_score=empty_score)
+
+
+def score_case(gt_fpath, pred_fpath, empty_score=1.0):
+    return score_label_maps(load_label_map(gt_fpath), load_label_map(pred_fpath), empty_score=empty_score)
+
+
+def find_case_segmentations(case_dir):
+    """
+    Subject ID, ground truth path and {model: prediction path} of a case folder laid out as the
+    QualitativeExamples ones (<subject>_seg_GroundTruth.nii.gz, <subject>_seg_<model>.nii.gz).
+    """
+    gt_fpaths = glob(os.path.join(case_dir, '*' + SEG_SUFFIX + GROUND_TRUTH + '.nii*'))
+    if len(gt_fpaths) != 1:
+        raise ValueError(f'Expected one ground truth segmentation in {case_dir}, found {len(gt_fpaths)}.')
+    gt_fpath = gt_fpaths[0]
+    subject = os.path.basename(gt_fpath).split(SEG_SUFFIX)[0]
+
+    pred_fpaths = {}
+    for fpath in sorted(glob(os.path.join(case_dir, subject + SEG_SUFFIX + '*.nii*'))):
+        model = os.path.basename(fpath)[len(subject + SEG_SUFFIX):].split('.nii')[0]
+        if model != GROUND_TRUTH:
+            pred_fpaths[model] = fpath
+    return subject, gt_fpath, pred_fpaths
+
+
+def score_case_files(subject, gt_fpath, pred_fpaths, empty_score=1.0):
+    """
+    Rows (dicts of SubjectID, Model and the score columns) for every {model: prediction path} of one case.
+    Volumes are streamed slab by slab, so memory per case stays at a few slabs, and the ground truth is
+    read once for all models.
+    """
+    confusions = streamed_label_confusions(gt_fpath, list(pred_fpaths.values()))
+    return [{'SubjectID': subject, 'Model': model, **scores_from_counts(*region_counts(confusion), empty_score=empty_score)}
+            for model, confusion in zip(pred_fpaths, confusions)]
+
+
+def score_case_dir(case_dir, empty_score=1.0):
+    """
+    Frame with one row per model segmentation of a case folder: SubjectID, Model and the score columns.
+    """
+    return pd.DataFrame(score_case_files(*find_case_segmentations(case_dir), empty_score=empty_score))
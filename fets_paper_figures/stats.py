@@ -0,0 +1,220 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import scipy.stats
+
+
+# scipy.stats.wilcoxon(method='auto') switches to the normal approximation above this many pairs,
+# and enumerates all sign flips for samples with ties or zeros up to this many pairs
+EXACT_MAX_N = 50
+PERMUTATION_MAX_N = 13
+
+
+@lru_cache(maxsize=None)
+def wilcoxon_null_counts(n):
+    """
+    Number of subsets of the ranks 1..n summing to each value 0..n(n+1)/2, i.e. 2**n times the exact
+    null distribution of the signed-rank statistic without ties. Cached per n, and built from n-1.
+    """
+    if n == 0:
+        return np.ones(1, dtype=np.int64)
+    previous = wilcoxon_null_counts(n - 1)
+    counts = np.zeros(len(previous) + n, dtype=np.int64)
+    counts[:len(previous)] += previous
+    counts[n:] += previous
+    return counts
+
+
+@lru_cache(maxsize=None)
+def _wilcoxon_null_cdf(n):
+    pmf = wilcoxon_null_counts(n) / 2.0**n
+    return np.cumsum(pmf)
+
+
+def average_ranks(a):
+    """
+    Column wise average ranks (ties get the mean of their positions, as rankdata(method='average'))
+    of a [n, m] array in which NaN marks entries to leave out. Also returns, for every entry, the size of
+    its tie group. Both are 0 for the left out entries.
+    """
+    n, m = a.shape
+    order = np.argsort(a, axis=0, kind='stable')
+    sorted_a = np.take_along_axis(a, order, axis=0)
+    valid = ~np.isnan(sorted_a)
+
+    starts = np.ones((n, m), dtype=bool)
+    starts[1:] = sorted_a[1:] != sorted_a[:-1]
+    ends = np.ones((n, m), dtype=bool)
+    ends[:-1] = starts[1:]
+
+    positions = np.broadcast_to(np.arange(n)[:, None], (n, m))
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=0)
+    last = np.minimum.accumulate(np.where(ends, positions, n - 1)[::-1], axis=0)[::-1]
+
+    sorted_ranks = np.where(valid, 0.5 * (first + last) + 1, 0.0)
+    sorted_ties = np.where(valid, last - first + 1, 0)
+
+    ranks = np.empty_like(sorted_ranks)
+    ties = np.empty_like(sorted_ties)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=0)
+    np.put_along_axis(ties, order, sorted_ties, axis=0)
+    return ranks, ties
+
+
+def _exact_pvalues(r_plus, counts):
+    """
+    Two sided p-values from the cached exact null distributions, grouping columns by sample size.
+    """
+    pvalues = np.empty(len(r_plus))
+    for n in np.unique(counts):
+        cols = np.nonzero(counts == n)[0]
+        cdf = _wilcoxon_null_cdf(int(n))
+        lower = np.ceil(r_plus[cols]).astype(np.int64)
+        upper = np.floor(r_plus[cols]).astype(np.int64)
+        p_less = cdf[np.clip(lower, 0, len(cdf) - 1)]
+        p_greater = 1.0 - np.where(upper > 0, cdf[np.clip(upper - 1, 0, len(cdf) - 1)], 0.0)
+        pvalues[cols] = np.clip(2 * np.minimum(p_greater, p_less), 0, 1)
+    return pvalues
+
+
+def _sign_flip_pvalues(r_plus, ranks, counts):
+    """
+    Two sided p-values by enumerating every sign flip of the non-zero differences, which is what
+    scipy's permutation test does for small samples with ties or zeros.
+    """
+    pvalues = np.empty(len(r_plus))
+    for col in range(len(r_plus)):
+        col_ranks = ranks[:, col][ranks[:, col] > 0]
+        n = int(counts[col])
+        signs = (np.arange(2**n)[:, None] >> np.arange(n)[None, :]) & 1
+        null = signs @ col_ranks
+        gamma = abs(np.finfo(np.float64).eps * 100 * r_plus[col])
+        p_less = np.mean(null <= r_plus[col] + gamma)
+        p_greater = np.mean(null >= r_plus[col] - gamma)
+        pvalues[col] = min(2 * min(p_less, p_greater), 1.0)
+    return pvalues
+
+
+def batched_wilcoxon(x, y):
+    """
+    Wilcoxon signed-rank tests for many paired comparisons at once, matching
+    scipy.stats.wilcoxon(x[:, j], y[:, j]) (two sided, zero_method='wilcox', no continuity
+    correction, method='auto') for every column j.
+
+    x and y are [n, m] arrays with one comparison per column. Shorter comparisons are padded with NaN:
+    a pair is used only when both values are present. Ranks are computed for all columns in one
+    vectorized pass. Exact p-values (no ties or zeros, at most 50 pairs) come from null distributions
+    cached per sample size. Larger samples use the tie-corrected normal approximation.
+    Returns (statistic, pvalue, n), with n the number of pairs used in each comparison.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.ndim == 1:
+        x, y = x[:, None], y[:, None]
+    if x.shape != y.shape:
+        raise ValueError(f'x and y must have the same shape, got {x.shape} and {y.shape}.')
+
+    d = x - y
+    n_pairs = np.sum(~np.isnan(d), axis=0)
+    n_zero = np.sum(d == 0, axis=0)
+
+    # zeros are dropped, as with zero_method='wilcox'
+    d = np.where(d == 0, np.nan, d)
+    counts = np.sum(~np.isnan(d), axis=0)
+    ranks, ties = average_ranks(np.abs(d))
+
+    r_plus = np.sum(np.where(d > 0, ranks, 0.0), axis=0)
+    r_minus = np.sum(np.where(d < 0, ranks, 0.0), axis=0)
+    has_ties = np.any(ties > 1, axis=0)
+
+    mean = counts * (counts + 1.0) * 0.25
+    var = counts * (counts + 1.0) * (2.0 * counts + 1.0)
+    # sum over tie groups of t**3 - t, accumulated per entry as t**2 - 1
+    tie_correction = np.sum(np.where(ties > 0, ties.astype(np.float64)**2 - 1, 0.0), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        se = np.sqrt((var - tie_correction / 2) / 24)
+        z = (r_plus - mean) / se
+    pvalues = np.clip(2 * scipy.stats.norm.sf(np.abs(z)), 0, 1)
+
+    exact = (n_pairs <= EXACT_MAX_N) & ~has_ties & (n_zero == 0) & (counts > 0)
+    if exact.any():
+        pvalues[exact] = _exact_pvalues(r_plus[exact], counts[exact])
+
+    flip = (n_pairs <= PERMUTATION_MAX_N) & (has_ties | (n_zero > 0)) & (counts > 0)
+    if flip.any():
+        pvalues[flip] = _sign_flip_pvalues(r_plus[flip], ranks[:, flip], counts[flip])
+
+    statistic = np.minimum(r_plus, r_minus)
+    pvalues = np.where(counts > 0, pvalues, np.nan)
+    return statistic, pvalues, n_pairs
+
+
+def paired_sample_matrix(df, group_columns, value_column):
+    """
+    Pivot a long frame into a [position, group] array: column g holds the values of the rows of group g
+    in the order they appear in df (the same arrays as df[mask][value_column].values for each group),
+    padded with NaN. Returns the array, a dict from group key to column and the number of rows of each group.
+    """
+    codes, uniques = pd.MultiIndex.from_frame(df[group_columns]).factorize(sort=False)
+    positions = pd.Series(codes).groupby(codes).cumcount().values
+    matrix = np.full((positions.max() + 1 if len(positions) else 0, len(uniques)), np.nan)
+    matrix[positions, codes] = df[value_column].to_numpy(dtype=np.float64)
+    lengths = np.bincount(codes, minlength=len(uniques))
+    return matrix, {key: col for col, key in enumerate(uniques.tolist())}, lengths
+
+
+def paired_wilcoxon(df, model_column, region_column, value_column, comparisons, regions=None, truncate=False):
+    """
+    Wilcoxon signed-rank tests of every (model_1, model_2) in comparisons, for every region, in one batch.
+
+    Replaces the scripts' loops that mask the samples of two models for one region out of a long frame
+    and call scipy.stats.wilcoxon. The frame is pivoted once into aligned [case, (model, region)] columns,
+    cases being paired by their order within each (model, region) as in those loops. When two models
+    have different numbers of cases a ValueError is raised (as scipy does), unless truncate is True, in
+    which case both lengths are printed and the extra cases of the longer one are left out. As with scipy's
+    default nan_policy, a missing value among the paired cases gives a NaN statistic and p-value.
+    Regions default to those of the frame, in order of appearance. Returns a frame with columns
+    model_1, model_2, region_column, statistic, pvalue and n.
+    """
+    matrix, columns, lengths = paired_sample_matrix(df, [model_column, region_column], value_column)
+    if regions is None:
+        regions = list(pd.unique(df[region_column]))
+
+    rows, x_cols, y_cols = [], [], []
+    for model_1, model_2 in comparisons:
+        for region in regions:
+            for model in (model_1, model_2):
+                if (model, region) not in columns:
+                    raise ValueError(f'There are no {value_column} values for {model} and {region}.')
+            x_col, y_col = columns[(model_1, region)], columns[(model_2, region)]
+            if lengths[x_col] != lengths[y_col]:
+                if not truncate:
+                    raise ValueError(f'{model_1} has {lengths[x_col]} and {model_2} has {lengths[y_col]} {value_column} values for {region}, '
+                                     'the samples must be of the same length.')
+                print(f"lengths of the {model_1} and {model_2} samples for {region} are: {lengths[x_col]} {lengths[y_col]}, "
+                      f"testing the first {min(lengths[x_col], lengths[y_col])} cases of each.")
+            rows.append((model_1, model_2, region))
+            x_cols.append(x_col)
+            y_cols.append(y_col)
+
+    statistic, pvalues, n = batched_wilcoxon(matrix[:, x_cols], matrix[:, y_cols])
+    missing = n < np.minimum(lengths[x_cols], lengths[y_cols])
+    result = pd.DataFrame(rows, columns=['model_1', 'model_2', region_column])
+    result['statistic'] = np.where(missing, np.nan, statistic)
+    result['pvalue'] = np.where(missing, np.nan, pvalues)
+    result['n'] = n
+    return result
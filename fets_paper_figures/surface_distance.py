@@ -0,0 +1,126 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+from scipy import ndimage
+
+from .nifti import read_nifti, read_nifti_header
+from .plotting import IN_DF_HD95, IN_DF_ASSD
+from .scoring import REGIONS, REGION_MEMBERSHIP, label_indices
+
+
+# 6-connected neighbourhood: a voxel is on the surface if one of its face neighbours is outside the structure
+_SURFACE_STRUCTURE = ndimage.generate_binary_structure(3, 1)
+
+# BraTS convention for a region present in only one of the volumes: the diagonal of the 240 x 240 x 155 mm
+# BraTS volume, the largest distance two of its voxels can have, rather than a NaN
+MISSING_DISTANCE = 373.13
+
+
+def bounding_box(mask, pad=1):
+    """
+    Slices of the smallest box holding every True voxel of mask, grown by pad voxels on each side
+    (clipped to the volume), or None if mask is empty.
+    """
+    slices = []
+    for axis in range(mask.ndim):
+        other_axes = tuple(a for a in range(mask.ndim) if a != axis)
+        nonzero = np.nonzero(np.any(mask, axis=other_axes))[0]
+        if len(nonzero) == 0:
+            return None
+        slices.append(slice(max(nonzero[0] - pad, 0), min(nonzero[-1] + 1 + pad, mask.shape[axis])))
+    return tuple(slices)
+
+
+def _surface(mask):
+    # border_value=0 so a structure touching the crop edge still has a surface there
+    return mask & ~ndimage.binary_erosion(mask, structure=_SURFACE_STRUCTURE, border_value=0)
+
+
+def surface_distances(gt_mask, pred_mask, spacing=(1.0, 1.0, 1.0)):
+    """
+    (distances from every predicted surface voxel to the ground truth surface, distances from every ground
+    truth surface voxel to the predicted surface), in the units of spacing.
+
+    Both masks are cropped to the bounding box of their union (plus one voxel), which holds every surface
+    voxel, so the two Euclidean distance transforms run on the structure's box instead of the full volume.
+    Returns None if either mask is empty.
+    """
+    box = bounding_box(gt_mask | pred_mask)
+    if box is None or not gt_mask[box].any() or not pred_mask[box].any():
+        return None
+    gt_surface = _surface(gt_mask[box])
+    pred_surface = _surface(pred_mask[box])
+    # distance of every voxel to the nearest surface voxel, read at the other surface's voxels
+    to_gt = ndimage.distance_transform_edt(~gt_surface, sampling=spacing)
+    to_pred = ndimage.distance_transform_edt(~pred_surface, sampling=spacing)
+    return to_gt[pred_surface], to_pred[gt_surface]
+
+
+def _surface_distance_scores_from_indices(gt_indices, pred_indices, spacing, percentile, missing_value):
+    # every region is inside the tumor (any non zero label), so both volumes are cropped to it once
+    box = bounding_box((gt_indices > 0) | (pred_indices > 0))
+    if box is not None:
+        gt_indices, pred_indices = gt_indices[box], pred_indices[box]
+    hd, assd = [], []
+    for membership in REGION_MEMBERSHIP:
+        gt_mask, pred_mask = membership[gt_indices], membership[pred_indices]
+        distances = surface_distances(gt_mask, pred_mask, spacing=spacing)
+        if distances is None:
+            both_empty = not gt_mask.any() and not pred_mask.any()
+            hd.append(0.0 if both_empty else missing_value)
+            assd.append(0.0 if both_empty else missing_value)
+            continue
+        pred_to_gt, gt_to_pred = distances
+        hd.append(max(np.percentile(pred_to_gt, percentile), np.percentile(gt_to_pred, percentile)))
+        assd.append((pred_to_gt.sum() + gt_to_pred.sum()) / (len(pred_to_gt) + len(gt_to_pred)))
+
+    scores = {}
+    for name, values in [(IN_DF_HD95, hd), (IN_DF_ASSD, assd)]:
+        values = np.asarray(values, dtype=np.float64)
+        measured = values[~np.isnan(values)]
+        scores['MeanBinary' + name] = measured.mean() if len(measured) else np.nan
+        for region, value in zip(REGIONS, values):
+            scores['binary_' + name + '_' + region] = value
+    return scores
+
+
+def surface_distance_scores(gt, pred, spacing=(1.0, 1.0, 1.0), percentile=95, missing_value=MISSING_DISTANCE):
+    """
+    Hausdorff distance (at percentile, 95 by default) and average symmetric surface distance of every
+    region of two label maps, and their means over regions, in the val_df column schema
+    (binary_HD95_WT, ..., MeanBinaryHD95, binary_ASSD_WT, ..., MeanBinaryASSD).
+
+    Regions empty in both volumes score 0, regions empty in only one of them score missing_value
+    (MISSING_DISTANCE by default, as in BraTS). The means are over the regions that are not NaN, so that
+    with missing_value=np.nan a case keeps the means of its other regions.
+    """
+    return _surface_distance_scores_from_indices(label_indices(gt), label_indices(pred), spacing, percentile, missing_value)
+
+
+def case_surface_distance_scores(gt_fpath, pred_fpaths, percentile=95, missing_value=MISSING_DISTANCE):
+    """
+    surface_distance_scores of the ground truth against every segmentation file of pred_fpaths, in mm using
+    the ground truth's voxel sizes. The ground truth is read and mapped to label indices once.
+    """
+    spacing = read_nifti_header(gt_fpath).pixdim
+    gt_indices = label_indices(read_nifti(gt_fpath))
+    return [_surface_distance_scores_from_indices(gt_indices, label_indices(read_nifti(fpath)), spacing, percentile, missing_value)
+            for fpath in pred_fpaths]
+
+
+def score_case_surface_distances(gt_fpath, pred_fpath, percentile=95, missing_value=MISSING_DISTANCE):
+    """
+    surface_distance_scores of two segmentation files, in mm using the ground truth's voxel sizes.
+    """
+    return case_surface_distance_scores(gt_fpath, [pred_fpath], percentile=percentile, missing_value=missing_value)[0]
@@ -0,0 +1,41 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+
+
+class ValidationIndex(object):
+    """
+    (TaskName, ModelVersion) -> row positions of a validation frame, built with one groupby.
+
+    compute_increases and get_comparison_df_detailed accept an index in place of the frame, so that
+    repeated per round queries (e.g. from a notebook) cost a take of the round's rows rather than
+    two boolean scans over the full frame.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.positions = df.groupby(['TaskName', 'ModelVersion'], observed=True, sort=False).indices
+        self._empty = np.array([], dtype=np.intp)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def rows(self, task, model_round):
+        """
+        The rows of df for one task and round (an empty frame if there are none), in their original order.
+        """
+        return self.df.take(self.positions.get((task, model_round), self._empty))
+
+    def rounds(self, task):
+        return sorted(model_round for key_task, model_round in self.positions if key_task == task)
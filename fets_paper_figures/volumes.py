@@ -0,0 +1,96 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .batch_scoring import discover_cases
+from .nifti import read_nifti_header
+from .plotting import BINARY_DICE, IN_DF_DICE
+from .scoring import BRATS_LABELS, REGIONS, REGION_MEMBERSHIP, label_voxel_counts
+
+
+VOXELS = 'Voxels'
+VOLUME = 'Volume (mm$^3$)'
+
+
+def _case_label_counts(gt_fpath):
+    return label_voxel_counts(gt_fpath), read_nifti_header(gt_fpath).voxel_volume
+
+
+def region_volume_frame(subjects, label_counts, voxel_volumes):
+    """
+    Long frame of SubjectID, Tumor Sub-Compartment, Voxels and Volume of every region of every case, from
+    a [case, label] matrix of BRATS_LABELS voxel counts and the voxel volume of every case.
+    Region counts are one product with the region membership of the labels.
+    """
+    counts = np.asarray(label_counts, dtype=np.int64) @ REGION_MEMBERSHIP.T.astype(np.int64)
+    volumes = counts * np.asarray(voxel_volumes, dtype=np.float64)[:, None]
+    return pd.DataFrame({'SubjectID': np.repeat(np.asarray(subjects, dtype=object), len(REGIONS)),
+                         BINARY_DICE: np.tile(REGIONS, len(subjects)),
+                         VOXELS: counts.ravel(),
+                         VOLUME: volumes.ravel()})
+
+
+def region_volumes(root_dir, n_jobs=1, chunksize=16):
+    """
+    region_volume_frame of the ground truth segmentation of every case found under root_dir
+    (see discover_cases), in mm^3 from each header's pixdim. Volumes are streamed slab by slab,
+    over n_jobs processes.
+    """
+    cases = discover_cases(root_dir)
+    subjects = [subject for subject, _, _ in cases]
+    gt_fpaths = [gt_fpath for _, gt_fpath, _ in cases]
+    if n_jobs == 1:
+        results = list(map(_case_label_counts, gt_fpaths))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_case_label_counts, gt_fpaths, chunksize=chunksize))
+    # explicit label count so that a root_dir without cases gives an empty frame
+    label_counts = np.array([counts for counts, _ in results], dtype=np.int64).reshape(len(results), len(BRATS_LABELS))
+    voxel_volumes = np.array([voxel_volume for _, voxel_volume in results], dtype=np.float64)
+    return region_volume_frame(subjects, label_counts, voxel_volumes)
+
+
+def join_region_volumes(scores, volumes):
+    """
+    Add the Voxels and Volume of the ground truth region to every row of a long per case score frame
+    (SubjectID and Tumor Sub-Compartment columns, as from holdout_frame). 'Average' rows get the whole
+    tumor's volume.
+    """
+    whole_tumor = volumes[volumes[BINARY_DICE] == 'WT'].assign(**{BINARY_DICE: 'Average'})
+    return scores.merge(pd.concat([volumes, whole_tumor], ignore_index=True), on=['SubjectID', BINARY_DICE], how='left')
+
+
+def binned_value_over_volume(df, value_column=IN_DF_DICE, volume_column=VOLUME, region_column=BINARY_DICE, n_bins=10):
+    """
+    Mean, standard error and count of value_column in volume bins of every region, with bins at the
+    quantiles of that region's volumes (so each holds about as many cases) and placed at their median volume.
+    Rows without a volume or value are left out.
+    """
+    df = df[[region_column, volume_column, value_column]].dropna()
+    binned = []
+    for region, region_df in df.groupby(region_column, sort=False):
+        volumes = region_df[volume_column].to_numpy()
+        edges = np.unique(np.quantile(volumes, np.linspace(0, 1, n_bins + 1)))
+        bins = np.clip(np.searchsorted(edges, volumes, side='right') - 1, 0, max(len(edges) - 2, 0))
+        grouped = region_df.groupby(bins)
+        stats = pd.DataFrame({volume_column: grouped[volume_column].median(),
+                              value_column: grouped[value_column].mean(),
+                              'sem': grouped[value_column].sem(),
+                              'count': grouped[value_column].size()})
+        stats.insert(0, region_column, region)
+        binned.append(stats.rename_axis('Bin').reset_index())
+    return pd.concat(binned, ignore_index=True)